@@ -0,0 +1,278 @@
+"""
+Reproducible benchmark of the contour fitting pipeline.
+
+Times, separately:
+    extract     contourExtract.extract_contours on synthetic silhouette PNGs
+                (frames/sec, decode + threshold + findContours + fit)
+    fit         fitCurves.fitCurve on the reference contours in
+                benchmark_contours.json, captured from all_video_contours.json
+    per function
+                the time fitCurve spends in generateBezier, reparameterize and
+                computeMaxError, measured by wrapping them during the fit run
+
+and writes the numbers to a JSON file, so runs from different commits can be
+compared with --compare. --simplify-report adds the accuracy/speed trade-off of
+contourExtract.simplify_contour for the given tolerance fractions.
+
+    python benchmark_fitting.py --output bench.json
+    python benchmark_fitting.py --output bench_new.json --compare bench.json
+    python benchmark_fitting.py --simplify-report 0.25 0.5 1
+    python benchmark_fitting.py --capture ../all_video_contours.json   # refresh the reference contours
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import cv2
+import numpy as np
+import bezier
+import contourExtract
+import fitCurves
+from synthetic_silhouettes import silhouette_frame, write_sequence
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_CONTOURS = os.path.join(HERE, "benchmark_contours.json")
+TIMED_FUNCTIONS = ("generateBezier", "reparameterize", "computeMaxError")
+
+
+def capture_reference_contours(all_video_contours_path, output_path=REFERENCE_CONTOURS, frames_per_video=2,
+                               size=(960, 540)):
+    """
+    Rasterizes a few stored frames per video and saves the contours findContours
+    returns for them, i.e. exactly the point lists fitCurve sees in production.
+    """
+    t = np.linspace(0, 1, 20, endpoint=False)[:, np.newaxis]
+    with open(all_video_contours_path) as f:
+        all_video_contours = json.load(f)
+    contours = []
+    for video, data in sorted(all_video_contours.items()):
+        frames = data["frames"]
+        for frame_idx in np.linspace(0, len(frames) - 1, min(frames_per_video, len(frames))).astype(int):
+            curves = [np.array(c, dtype=float).reshape(4, 2) for c in frames[frame_idx]
+                      if isinstance(c, list) and len(c) == 8]
+            polygon = np.concatenate([(1-t)**3 * c[0] + 3*(1-t)**2*t * c[1] + 3*(1-t)*t**2 * c[2] + t**3 * c[3]
+                                      for c in curves])
+            mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+            cv2.fillPoly(mask, [np.round(polygon).astype(np.int32)], 255)
+            found, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            points = max(found, key=len).reshape(-1)
+            contours.append({"video": video, "frame": int(frame_idx), "points": points.tolist()})
+    with open(output_path, "w") as f:
+        json.dump({"source": os.path.basename(all_video_contours_path), "contours": contours}, f)
+    return len(contours)
+
+
+def load_reference_contours(path=REFERENCE_CONTOURS):
+    """Returns the reference contours as a list of (N, 2) float arrays."""
+    with open(path) as f:
+        return [np.array(c["points"], dtype=float).reshape(-1, 2) for c in json.load(f)["contours"]]
+
+
+def _best_of(repeats, run):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_fit(contours, max_error=4, repeats=3):
+    """Time fitCurve over every contour, plus a breakdown of its three inner functions."""
+    fit_all = lambda: [fitCurves.fitCurve(points, max_error) for points in contours]
+    seconds = _best_of(repeats, fit_all)
+
+    # second pass with the inner functions wrapped; fitCurves calls them through
+    # its module globals, so patching the module attributes is enough
+    totals = {name: [0.0, 0] for name in TIMED_FUNCTIONS}
+    originals = {name: getattr(fitCurves, name) for name in TIMED_FUNCTIONS}
+
+    def timed(name, function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals[name][0] += time.perf_counter() - start
+                totals[name][1] += 1
+        return wrapper
+
+    for name, function in originals.items():
+        setattr(fitCurves, name, timed(name, function))
+    try:
+        curves = fit_all()
+    finally:
+        for name, function in originals.items():
+            setattr(fitCurves, name, function)
+
+    return {
+        "contours": len(contours),
+        "points": int(sum(len(points) for points in contours)),
+        "curves": int(sum(len(c) for c in curves)),
+        "seconds": seconds,
+        "contours_per_sec": len(contours) / seconds,
+        "functions": {name: {"seconds": total, "calls": calls, "us_per_call": 1e6 * total / max(calls, 1)}
+                      for name, (total, calls) in totals.items()},
+    }
+
+
+def bench_extract(frames=30, width=960, height=540, complexity=8, seed=0, repeats=3):
+    """Frames/sec of contourExtract.extract_contours on a synthetic sequence."""
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_sequence(folder, frames, width, height, complexity, seed)
+        curves = [contourExtract.extract_contours(path) for path in paths]
+        seconds = _best_of(repeats, lambda: [contourExtract.extract_contours(path) for path in paths])
+    return {
+        "frames": frames, "width": width, "height": height, "complexity": complexity,
+        "curves_per_frame": sum(len(c) for c in curves) / frames,
+        "seconds": seconds,
+        "frames_per_sec": frames / seconds,
+    }
+
+
+def synthetic_contours(count=4, width=3840, height=2160, complexity=16, seed=0):
+    """findContours output for a few synthetic silhouettes, rendered in memory."""
+    contours = []
+    for t in range(count):
+        alpha = silhouette_frame(width, height, complexity, t, seed)[..., 3]
+        found, _ = cv2.findContours(alpha, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours.append(max(found, key=len).reshape(-1, 2).astype(float))
+    return contours
+
+
+def curve_deviation(points, curves, chunk=1024):
+    """
+    Distance in px from every contour point to the nearest point of the fitted
+    curves, sampled about every half pixel. Returns (max, mean).
+    """
+    curves = [np.asarray(curve, dtype=float) for curve in curves]
+    samples = []
+    for i, curve in enumerate(curves):
+        if not np.isfinite(curve).all():
+            # extract_contours serializes these as a straight line between the neighbouring curves
+            curve = np.linspace(curves[i - 1][-1], curves[(i + 1) % len(curves)][0], 4)
+        n = max(8, int(np.ceil(2 * np.linalg.norm(np.diff(curve, axis=0), axis=1).sum())))
+        samples.append(bezier.qBatch(curve[np.newaxis], np.linspace(0, 1, n))[0])
+    samples = np.concatenate(samples)
+    nearest = np.concatenate([
+        np.sqrt(((points[i:i + chunk, np.newaxis] - samples[np.newaxis]) ** 2).sum(axis=2).min(axis=1))
+        for i in range(0, len(points), chunk)])
+    return float(nearest.max()), float(nearest.mean())
+
+
+def bench_simplify(contours, fractions, max_error=4, repeats=3):
+    """
+    Fit time, curve count and accuracy of fitCurve after simplify_contour, for
+    every tolerance fraction plus 0 (the unsimplified fit) as the baseline.
+    Deviation is always measured against the original, unsimplified points.
+    """
+    results = []
+    for fraction in [0] + [f for f in fractions if f > 0]:
+        simplified = [contourExtract.simplify_contour(points, max_error, fraction) for points in contours]
+        fit_all = lambda: [fitCurves.fitCurve(points, max_error) for points in simplified]
+        seconds = _best_of(repeats, fit_all)
+        curves = fit_all()
+        deviations = [curve_deviation(points, c) for points, c in zip(contours, curves)]
+        results.append({
+            "fraction": fraction,
+            "points": int(sum(len(points) for points in simplified)),
+            "curves": int(sum(len(c) for c in curves)),
+            "seconds": seconds,
+            "max_deviation_px": max(d[0] for d in deviations),
+            "mean_deviation_px": float(np.mean([d[1] for d in deviations])),
+        })
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(complexities=(4, 16), sizes=((960, 540),), frames=30, repeats=3, max_error=4,
+                   simplify_fractions=()):
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "fit": bench_fit(load_reference_contours(), max_error, repeats),
+        "extract": [bench_extract(frames, width, height, complexity, repeats=repeats)
+                    for width, height in sizes for complexity in complexities],
+    }
+    if simplify_fractions:
+        results["simplify"] = {
+            "reference": bench_simplify(load_reference_contours(), simplify_fractions, max_error, repeats),
+            "synthetic_4k": bench_simplify(synthetic_contours(), simplify_fractions, max_error, repeats),
+        }
+    return results
+
+
+def print_results(results, baseline=None):
+    def speedup(new, old):
+        return f"  ({old / new:.2f}x vs {baseline['commit'] or 'baseline'})" if old else ""
+
+    fit = results["fit"]
+    old_fit = baseline["fit"] if baseline else {}
+    print(f"fitCurve: {fit['contours']} contours, {fit['points']} points -> {fit['curves']} curves, "
+          f"{fit['seconds'] * 1000:.1f} ms, {fit['contours_per_sec']:.1f} contours/s"
+          f"{speedup(fit['seconds'], old_fit.get('seconds'))}")
+    for name, entry in fit["functions"].items():
+        old = old_fit.get("functions", {}).get(name, {}).get("seconds")
+        print(f"  {name:<16}{entry['seconds'] * 1000:>9.1f} ms {entry['calls']:>7} calls "
+              f"{entry['us_per_call']:>8.1f} us/call{speedup(entry['seconds'], old)}")
+    old_extract = {(e["width"], e["height"], e["complexity"]): e for e in baseline["extract"]} if baseline else {}
+    for entry in results["extract"]:
+        # runs may use different frame counts, so compare time per frame
+        old = old_extract.get((entry["width"], entry["height"], entry["complexity"]), {}).get("frames_per_sec")
+        print(f"extract_contours {entry['width']}x{entry['height']} complexity {entry['complexity']:>3}: "
+              f"{entry['frames_per_sec']:.1f} frames/s, {entry['curves_per_frame']:.1f} curves/frame"
+              f"{speedup(1 / entry['frames_per_sec'], old and 1 / old)}")
+    for name, entries in results.get("simplify", {}).items():
+        print(f"simplify_contour on {name} contours (deviation of the original points from the fit):")
+        base = entries[0]
+        for entry in entries:
+            label = f"{entry['fraction']:g}" if entry["fraction"] else "off"
+            print(f"  {label:>5}: {entry['points']:>7} points {entry['curves']:>6} curves "
+                  f"{entry['seconds'] * 1000:>8.1f} ms ({base['seconds'] / entry['seconds']:.2f}x)  "
+                  f"deviation max {entry['max_deviation_px']:.2f} px, mean {entry['mean_deviation_px']:.3f} px")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark contour extraction and Bezier fitting.")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", default=None, help="Results JSON of an earlier run to report speedups against.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repetitions; the fastest one is reported.")
+    parser.add_argument("--frames", type=int, default=30, help="Synthetic frames per extract_contours run.")
+    parser.add_argument("--complexity", type=int, nargs="+", default=[4, 16],
+                        help="Synthetic silhouette complexities to time extract_contours on.")
+    parser.add_argument("--size", type=int, nargs=2, action="append", metavar=("WIDTH", "HEIGHT"),
+                        help="Synthetic frame size; may be given several times (default 960 540).")
+    parser.add_argument("--simplify-report", type=float, nargs="+", default=[], metavar="FRACTION",
+                        help="Also report fit time and accuracy after simplify_contour with these tolerance fractions.")
+    parser.add_argument("--capture", default=None, metavar="ALL_VIDEO_CONTOURS_JSON",
+                        help="Regenerate benchmark_contours.json from this file and exit.")
+    args = parser.parse_args()
+
+    if args.capture:
+        print(f"Captured {capture_reference_contours(args.capture)} contours to {REFERENCE_CONTOURS}")
+    else:
+        results = run_benchmarks(args.complexity, [tuple(s) for s in args.size or [(960, 540)]], args.frames,
+                                 args.repeats, simplify_fractions=args.simplify_report)
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print_results(results, baseline)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results saved to {args.output}")
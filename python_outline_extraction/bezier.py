@@ -17,3 +17,31 @@ def qprimeprime(ctrlPoly, t):
     return 6*(1.0-t) * (ctrlPoly[2]-2*ctrlPoly[1]+ctrlPoly[0]) + 6*(t) * (ctrlPoly[3]-2*ctrlPoly[2]+ctrlPoly[1])
 
 
+
+
+# Bernstein basis of a cubic bezier at every t, shape (len(t), 4)
+def bernstein(t):
+    t = asarray(t, dtype=float)[:, newaxis]
+    s = 1.0-t
+    return hstack([s*s*s, 3*s*s*t, 3*s*t*t, t*t*t])
+
+
+# evaluates N cubic beziers at every t, curves shape (N, 4, 2), return points shape (N, len(t), 2)
+def qBatch(curves, t):
+    return matmul(bernstein(t), asarray(curves, dtype=float))
+
+
+# evaluates N cubic bezier first derivatives at every t, return shape (N, len(t), 2)
+def qprimeBatch(curves, t):
+    curves = asarray(curves, dtype=float)
+    t = asarray(t, dtype=float)[:, newaxis]
+    basis = hstack([3*(1.0-t)**2, 6*(1.0-t)*t, 3*t**2])
+    return matmul(basis, diff(curves, axis=1))
+
+
+# evaluates N cubic bezier second derivatives at every t, return shape (N, len(t), 2)
+def qprimeprimeBatch(curves, t):
+    curves = asarray(curves, dtype=float)
+    t = asarray(t, dtype=float)[:, newaxis]
+    basis = hstack([6*(1.0-t), 6*t])
+    return matmul(basis, diff(curves, n=2, axis=1))
@@ -0,0 +1,191 @@
+""" Checks the vectorized fitCurves against the original per-point
+    implementation and times both.
+
+    The reference below is the original recursive, loop-based fitter. Its
+    knobs are singularTolerance: 0 reproduces the original exact `det == 0`
+    test, while fitCurves.SINGULAR_TOLERANCE applies the same relative test as
+    the vectorized code; and spikeTangent, which uses fitCurves.splitTangent's
+    perpendicular at split points whose neighbours coincide (the tip of a one
+    pixel spike), where the original tangent is NaN. With both matching the
+    vectorized code both must produce the same control points; the original
+    also differs on segments whose C matrix is singular (parallel end
+    tangents), where its result depended on summation rounding, and on spikes,
+    where it returned NaN curves.
+
+    usage: python check_fitCurves.py [all_video_contours.json]
+"""
+from __future__ import print_function
+import json
+import sys
+import time
+import numpy as np
+import fitCurves
+
+
+def refQ(ctrlPoly, t):
+    return (1.0-t)**3 * ctrlPoly[0] + 3*(1.0-t)**2 * t * ctrlPoly[1] + 3*(1.0-t)* t**2 * ctrlPoly[2] + t**3 * ctrlPoly[3]
+
+
+def refQprime(ctrlPoly, t):
+    return 3*(1.0-t)**2 * (ctrlPoly[1]-ctrlPoly[0]) + 6*(1.0-t) * t * (ctrlPoly[2]-ctrlPoly[1]) + 3*t**2 * (ctrlPoly[3]-ctrlPoly[2])
+
+
+def refQprimeprime(ctrlPoly, t):
+    return 6*(1.0-t) * (ctrlPoly[2]-2*ctrlPoly[1]+ctrlPoly[0]) + 6*(t) * (ctrlPoly[3]-2*ctrlPoly[2]+ctrlPoly[1])
+
+
+def refFitCurve(points, maxError, singularTolerance=0.0, spikeTangent=False):
+    leftTangent = refNormalize(points[1] - points[0])
+    rightTangent = refNormalize(points[-2] - points[-1])
+    return refFitCubic(points, leftTangent, rightTangent, maxError, singularTolerance, spikeTangent)
+
+
+def refFitCubic(points, leftTangent, rightTangent, error, singularTolerance, spikeTangent=False):
+    if (len(points) == 2):
+        dist = np.linalg.norm(points[0] - points[1]) / 3.0
+        return [[points[0], points[0] + leftTangent * dist, points[1] + rightTangent * dist, points[1]]]
+
+    u = refChordLengthParameterize(points)
+    bezCurve = refGenerateBezier(points, u, leftTangent, rightTangent, singularTolerance)
+    maxError, splitPoint = refComputeMaxError(points, bezCurve, u)
+    if maxError < error:
+        return [bezCurve]
+
+    if maxError < error**2:
+        for i in range(20):
+            uPrime = [refNewtonRaphsonRootFind(bezCurve, point, u) for point, u in zip(points, u)]
+            bezCurve = refGenerateBezier(points, uPrime, leftTangent, rightTangent, singularTolerance)
+            maxError, splitPoint = refComputeMaxError(points, bezCurve, uPrime)
+            if maxError < error:
+                return [bezCurve]
+            u = uPrime
+
+    beziers = []
+    v = points[splitPoint-1] - points[splitPoint+1]
+    if spikeTangent and not v.any():
+        d = points[splitPoint-1] - points[splitPoint]
+        v = np.array([-d[1], d[0]])
+    centerTangent = refNormalize(v)
+    beziers += refFitCubic(points[:splitPoint+1], leftTangent, centerTangent, error, singularTolerance, spikeTangent)
+    beziers += refFitCubic(points[splitPoint:], -centerTangent, rightTangent, error, singularTolerance, spikeTangent)
+    return beziers
+
+
+def refGenerateBezier(points, parameters, leftTangent, rightTangent, singularTolerance):
+    bezCurve = [points[0], None, None, points[-1]]
+
+    A = np.zeros((len(parameters), 2, 2))
+    for i, u in enumerate(parameters):
+        A[i][0] = leftTangent  * 3*(1-u)**2 * u
+        A[i][1] = rightTangent * 3*(1-u)    * u**2
+
+    C = np.zeros((2, 2))
+    X = np.zeros(2)
+    for i, (point, u) in enumerate(zip(points, parameters)):
+        C[0][0] += np.dot(A[i][0], A[i][0])
+        C[0][1] += np.dot(A[i][0], A[i][1])
+        C[1][0] += np.dot(A[i][0], A[i][1])
+        C[1][1] += np.dot(A[i][1], A[i][1])
+        tmp = point - refQ([points[0], points[0], points[-1], points[-1]], u)
+        X[0] += np.dot(A[i][0], tmp)
+        X[1] += np.dot(A[i][1], tmp)
+
+    det_C0_C1 = C[0][0] * C[1][1] - C[1][0] * C[0][1]
+    det_C0_X  = C[0][0] * X[1] - C[1][0] * X[0]
+    det_X_C1  = X[0] * C[1][1] - X[1] * C[0][1]
+
+    singular = abs(det_C0_C1) <= singularTolerance * C[0][0] * C[1][1]
+    alpha_l = 0.0 if singular else det_X_C1 / det_C0_C1
+    alpha_r = 0.0 if singular else det_C0_X / det_C0_C1
+
+    segLength = np.linalg.norm(points[0] - points[-1])
+    epsilon = 1.0e-6 * segLength
+    if alpha_l < epsilon or alpha_r < epsilon:
+        bezCurve[1] = bezCurve[0] + leftTangent * (segLength / 3.0)
+        bezCurve[2] = bezCurve[3] + rightTangent * (segLength / 3.0)
+    else:
+        bezCurve[1] = bezCurve[0] + leftTangent * alpha_l
+        bezCurve[2] = bezCurve[3] + rightTangent * alpha_r
+    return bezCurve
+
+
+def refNewtonRaphsonRootFind(bez, point, u):
+    d = refQ(bez, u)-point
+    numerator = (d * refQprime(bez, u)).sum()
+    denominator = (refQprime(bez, u)**2 + d * refQprimeprime(bez, u)).sum()
+    if denominator == 0.0:
+        return u
+    return u - numerator/denominator
+
+
+def refChordLengthParameterize(points):
+    u = [0.0]
+    for i in range(1, len(points)):
+        u.append(u[i-1] + np.linalg.norm(points[i] - points[i-1]))
+    return [x / u[-1] for x in u]
+
+
+def refComputeMaxError(points, bez, parameters):
+    maxDist = 0.0
+    splitPoint = len(points)//2
+    for i, (point, u) in enumerate(zip(points, parameters)):
+        dist = np.linalg.norm(refQ(bez, u)-point)**2
+        if dist > maxDist:
+            maxDist = dist
+            splitPoint = i
+    return maxDist, splitPoint
+
+
+def refNormalize(v):
+    return v / np.linalg.norm(v)
+
+
+def noisyCircles(count=30, seed=0):
+    rng = np.random.default_rng(seed)
+    contours = []
+    for k in range(count):
+        n = rng.integers(40, 300)
+        t = np.linspace(0, 2*np.pi, n, endpoint=False)
+        r = 100 + rng.normal(0, 3, n)
+        contours.append(np.round(np.stack([200 + r*np.cos(t), 200 + r*np.sin(t)], 1)))
+    return contours
+
+
+def storedContours(jsonPath, framesPerVideo=3, samplesPerCurve=20):
+    """Densely sampled polylines of the curves stored in all_video_contours.json."""
+    t = np.linspace(0, 1, samplesPerCurve, endpoint=False)[:, np.newaxis]
+    contours = []
+    with open(jsonPath) as f:
+        allVideoContours = json.load(f)
+    for video in allVideoContours.values():
+        for frame in video['frames'][:framesPerVideo]:
+            curves = [np.array(c, dtype=float).reshape(4, 2) for c in frame if isinstance(c, list) and len(c) == 8]
+            points = np.round(np.concatenate([refQ(c, t) for c in curves]))
+            # findContours never repeats a point, so drop rounding duplicates
+            keep = np.concatenate(([True], (np.diff(points, axis=0) != 0).any(axis=1)))
+            contours.append(points[keep])
+    return contours
+
+
+def compare(contours, maxError=4):
+    results = {}
+    for name, fit in [('reference', lambda p: refFitCurve(p, maxError, fitCurves.SINGULAR_TOLERANCE, True)),
+                      ('original', lambda p: refFitCurve(p, maxError, 0.0)),
+                      ('vectorized', lambda p: fitCurves.fitCurve(p, maxError))]:
+        start = time.perf_counter()
+        results[name] = [np.array([np.asarray(point, dtype=float) for curve in fit(p) for point in curve])
+                         for p in contours]
+        print('%-10s %8.3fs' % (name, time.perf_counter() - start))
+
+    for name in ['reference', 'original']:
+        mismatches = [i for i, (a, b) in enumerate(zip(results[name], results['vectorized']))
+                      if a.shape != b.shape or not np.allclose(a, b, atol=1e-6, equal_nan=True)]
+        print('vectorized vs %-9s: %d of %d contours differ %s' % (name, len(mismatches), len(contours), mismatches))
+    return results
+
+
+if __name__ == "__main__":
+    contours = noisyCircles()
+    if len(sys.argv) > 1:
+        contours += storedContours(sys.argv[1])
+    results = compare(contours)
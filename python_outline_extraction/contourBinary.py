@@ -0,0 +1,229 @@
+"""
+Compact binary container for contour extraction results.
+
+Holds the same data as all_video_contours.json ({video: {"frames": [[curve, ...], ...]}},
+each curve being [x1,y1,x2,y2,x3,y3,x4,y4]) as flat arrays that can be memory-mapped:
+
+    8 bytes   magic b"CONTOURS"
+    8 bytes   little-endian uint64 length of the JSON header
+    ...       JSON header, padded with spaces to a multiple of 8 bytes
+    ...       per video: an int64 frame offset index of length frames+1 (in curves),
+              followed by a (curves, 8) control point array of int16 or float32
+              and, for multi-contour results, an int64 frame offset index of
+              length frames+1 (in contours) and a (contours, 3) int32 array of
+              [first_curve, curve_count, parent] rows
+
+The header maps every video name to its dtype, frame/curve counts and the byte
+offsets of its arrays, so any frame can be read without touching the rest.
+Videos without a contour index have no "contours" entry in the header.
+"""
+import json
+import struct
+import sys
+import numpy as np
+
+MAGIC = b"CONTOURS"
+VALUES_PER_CURVE = 8
+
+
+def frame_array(frame):
+  # the weird curve fallback in contourExtract can leave bare ints in a frame,
+  # so flatten everything and regroup into curves of 8 values
+  values = []
+  for curve in frame:
+    if isinstance(curve, list):
+      values.extend(curve)
+    else:
+      values.append(curve)
+  return np.asarray(values, dtype=np.float64).reshape((-1, VALUES_PER_CURVE))
+
+
+def _fits_int16(data):
+  int16 = np.iinfo(np.int16)
+  return len(data) == 0 or (data.min() >= int16.min and data.max() <= int16.max)
+
+
+def _pick_dtype(data, dtype):
+  if dtype == "auto":
+    if _fits_int16(data) and np.all(data == np.round(data)):
+      return np.dtype(np.int16)
+    return np.dtype(np.float32)
+  # casting would silently wrap out of range values (40000 -> -25536)
+  if np.dtype(dtype) == np.int16 and not _fits_int16(data):
+    raise ValueError(f"coordinates outside [{np.iinfo(np.int16).min}, {np.iinfo(np.int16).max}] "
+                     f"do not fit int16, use float32 or auto")
+  return np.dtype(dtype)
+
+
+def _pad(n):
+  return (-n) % 8
+
+
+def write_contours_binary(all_video_contours, path, dtype="auto"):
+  """
+  Writes a {video: {"frames": [...]}} dict to path.
+
+  Parameters:
+      all_video_contours: Output of contourExtract.extract_contours_from_folder_of_videos.
+      path: Output file path.
+      dtype: "int16", "float32" or "auto" to use int16 per video whenever every
+             coordinate is an integer that fits and float32 otherwise. Forcing
+             int16 rounds fractional coordinates and raises ValueError when
+             one is out of range.
+  """
+  videos = {}
+  arrays = []
+  for name, video in all_video_contours.items():
+    frames = [frame_array(frame) for frame in video["frames"]]
+    index = np.zeros(len(frames) + 1, dtype=np.int64)
+    index[1:] = np.cumsum([len(frame) for frame in frames])
+    data = np.concatenate(frames) if frames else np.zeros((0, VALUES_PER_CURVE))
+    video_dtype = _pick_dtype(data, dtype)
+    videos[name] = {"dtype": video_dtype.str, "frames": len(frames), "curves": int(index[-1])}
+    if video_dtype.kind == "i":
+      data = np.round(data)
+    video_arrays = [("index_offset", index), ("data_offset", data.astype(video_dtype))]
+    if "contours" in video:
+      rows = [np.asarray(frame_rows, dtype=np.int32).reshape((-1, 3)) for frame_rows in video["contours"]]
+      contour_index = np.zeros(len(rows) + 1, dtype=np.int64)
+      contour_index[1:] = np.cumsum([len(frame_rows) for frame_rows in rows])
+      videos[name]["contours"] = int(contour_index[-1])
+      video_arrays += [("contour_index_offset", contour_index),
+                       ("contour_data_offset", np.concatenate(rows) if rows else np.zeros((0, 3), np.int32))]
+    arrays.append((name, video_arrays))
+
+  # the array offsets depend on the header length and vice versa, so lay out
+  # until the padded header length stops changing
+  header_len = 0
+  while True:
+    offset = len(MAGIC) + 8 + header_len
+    for name, video_arrays in arrays:
+      for key, array in video_arrays:
+        videos[name][key] = offset
+        offset += array.nbytes + _pad(array.nbytes)
+    header = json.dumps({"version": 1, "videos": videos}).encode()
+    needed = len(header) + _pad(len(header))
+    if needed == header_len:
+      break
+    header_len = needed
+
+  with open(path, "wb") as f:
+    f.write(MAGIC)
+    f.write(struct.pack("<Q", header_len))
+    f.write(header + b" " * (header_len - len(header)))
+    for _, video_arrays in arrays:
+      for _, array in video_arrays:
+        f.write(array.astype(array.dtype.newbyteorder("<")).tobytes())
+        f.write(b"\0" * _pad(array.nbytes))
+
+
+class ContourBinaryReader:
+  """Memory-mapped random access to a file written by write_contours_binary."""
+
+  def __init__(self, path):
+    with open(path, "rb") as f:
+      if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} is not a contour binary file")
+      header_len, = struct.unpack("<Q", f.read(8))
+      self.header = json.loads(f.read(header_len))
+    self.path = path
+    self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+  def videos(self):
+    return list(self.header["videos"])
+
+  def num_frames(self, video):
+    return self.header["videos"][video]["frames"]
+
+  def _arrays(self, video):
+    info = self.header["videos"][video]
+    index = np.frombuffer(self._buffer, dtype="<i8", count=info["frames"] + 1, offset=info["index_offset"])
+    data = np.frombuffer(self._buffer, dtype=info["dtype"], count=info["curves"] * VALUES_PER_CURVE,
+                         offset=info["data_offset"]).reshape((-1, VALUES_PER_CURVE))
+    return index, data
+
+  def _contour_arrays(self, video):
+    info = self.header["videos"][video]
+    if "contours" not in info:
+      return None
+    index = np.frombuffer(self._buffer, dtype="<i8", count=info["frames"] + 1, offset=info["contour_index_offset"])
+    rows = np.frombuffer(self._buffer, dtype="<i4", count=info["contours"] * 3,
+                         offset=info["contour_data_offset"]).reshape((-1, 3))
+    return index, rows
+
+  def frame(self, video, frame_idx):
+    """Returns the (curves, 8) control points of one frame as a read-only view."""
+    index, data = self._arrays(video)
+    return data[index[frame_idx]:index[frame_idx + 1]]
+
+  def curves(self, video):
+    """Returns (index, data): the frame offset index and the flat (curves, 8) array of a video."""
+    return self._arrays(video)
+
+  def fixed_curves(self, video):
+    """
+    Returns the curves of a video whose frames all have the same number of
+    curves (see contourExtract's exact_budget) as one read-only
+    (frames, curves_per_frame, 8) view, ready to be copied to a GPU buffer.
+    Raises ValueError if the curve counts differ.
+    """
+    index, data = self._arrays(video)
+    counts = np.diff(index)
+    if len(counts) and np.any(counts != counts[0]):
+      raise ValueError(f"{video} has between {counts.min()} and {counts.max()} curves per frame")
+    return data.reshape((len(counts), counts[0] if len(counts) else 0, VALUES_PER_CURVE))
+
+  def frame_contours(self, video, frame_idx):
+    """
+    Returns the (contours, 3) [first_curve, curve_count, parent] rows of one
+    frame, or None if the video was extracted without a contour index.
+    """
+    arrays = self._contour_arrays(video)
+    if arrays is None:
+      return None
+    index, rows = arrays
+    return rows[index[frame_idx]:index[frame_idx + 1]]
+
+  def to_json_dict(self):
+    """
+    Rebuilds the {video: {"frames": [...]}} structure of all_video_contours.json,
+    including the "contours" index of multi-contour videos.
+    float32 coordinates are rounded to the nearest integer, since the JSON format holds integers.
+    """
+    all_video_contours = {}
+    for video in self.videos():
+      index, data = self._arrays(video)
+      values = data.tolist()
+      if data.dtype.kind == "f":
+        values = [[int(round(v)) for v in curve] for curve in values]
+      all_video_contours[video] = {"frames": [values[index[i]:index[i + 1]] for i in range(len(index) - 1)]}
+      contour_arrays = self._contour_arrays(video)
+      if contour_arrays is not None:
+        contour_index, rows = contour_arrays
+        rows = rows.tolist()
+        all_video_contours[video]["contours"] = [rows[contour_index[i]:contour_index[i + 1]]
+                                                 for i in range(len(contour_index) - 1)]
+    return all_video_contours
+
+
+def export_json(binary_path, json_path, indent=None):
+  with open(json_path, "w") as f:
+    json.dump(ContourBinaryReader(binary_path).to_json_dict(), f, indent=indent)
+
+
+if __name__ == "__main__":
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Convert between all_video_contours.json and the binary contour format.")
+  parser.add_argument("input", help="A .json file to pack or a binary file to export.")
+  parser.add_argument("output", help="Output path.")
+  parser.add_argument("--dtype", choices=["auto", "int16", "float32"], default="auto",
+                      help="Control point dtype when packing JSON.")
+  args = parser.parse_args()
+
+  if args.input.endswith(".json"):
+    with open(args.input) as f:
+      write_contours_binary(json.load(f), args.output, args.dtype)
+  else:
+    export_json(args.input, args.output)
+  print(f"Wrote {args.output}", file=sys.stderr)
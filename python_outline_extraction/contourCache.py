@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import tempfile
+
+# bump whenever the fitter changes in a way that alters its output
+CACHE_VERSION = 1
+
+
+class ContourCache:
+  """
+  Persistent on-disk cache of per-frame contour fits.
+
+  Entries are keyed by a hash of the frame's file contents plus the fit
+  parameters, and stored as one small JSON file each, sharded into
+  subfolders by the first two hex digits of the key. Every hit refreshes the
+  entry's mtime, and evict() removes the least recently used entries until
+  the cache fits in max_bytes.
+
+  Only paths are stored on the instance, so it can be handed to pool workers.
+  """
+
+  def __init__(self, cache_dir, max_bytes=1 << 30):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def key(self, image_path, **params):
+    """Hash the frame at image_path together with the parameters used to fit it."""
+    h = hashlib.sha1()
+    with open(image_path, "rb") as f:
+      for block in iter(lambda: f.read(1 << 20), b""):
+        h.update(block)
+    h.update(json.dumps(dict(params, version=CACHE_VERSION), sort_keys=True).encode())
+    return h.hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+  def get(self, key):
+    """Return the cached value for key, or None on a miss."""
+    path = self._path(key)
+    try:
+      with open(path) as f:
+        value = json.load(f)
+    except (OSError, ValueError):
+      return None
+    # mark as recently used for eviction
+    os.utime(path)
+    return value
+
+  def put(self, key, value):
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temp file and rename so concurrent workers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+      json.dump(value, f)
+    os.replace(tmp_path, path)
+
+  def evict(self):
+    """Delete least recently used entries until the cache is at most max_bytes."""
+    entries = []
+    for root, _, files in os.walk(self.cache_dir):
+      for name in files:
+        if not name.endswith(".json"):
+          continue
+        path = os.path.join(root, name)
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      total -= size
@@ -1,17 +1,22 @@
-import sys
 import cv2 #via pip install opencv-python
 import numpy as np
 import fitCurves
 import os
 import json
+import multiprocessing
+import functools
+import time
+from contourCache import ContourCache
+from contourMetrics import ContourMetrics
+from maskSource import AlphaMaskSource
+import contourRender
 
 
 debug = False
 drawContours = False
 
-def cubic_bezier_curve(P0, P1, P2, P3, t):
-    """Compute a point on a cubic Bézier curve for parameter t."""
-    return (1 - t)**3 * P0 + 3 * (1 - t)**2 * t * P1 + 3 * (1 - t) * t**2 * P2 + t**3 * P3
+# video files picked up by extract_contours_from_folder_of_videos
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".webm")
 
 def draw_bezier_curve(image, control_points, color=(255, 0, 0), thickness=5):
     """
@@ -23,28 +28,254 @@ def draw_bezier_curve(image, control_points, color=(255, 0, 0), thickness=5):
         color: The color of the curve.
         thickness: The thickness of the curve.
     """
-    for curve in control_points:
-        P0, P1, P2, P3 = curve
-        # Generate points along the Bézier curve
-        bezier_points = np.array([cubic_bezier_curve(P0, P1, P2, P3, t) for t in np.linspace(0, 1, 100)], dtype=np.int32)
-        
-        # Draw the curve by connecting consecutive points
-        for i in range(len(bezier_points) - 1):
-            cv2.line(image, tuple(bezier_points[i]), tuple(bezier_points[i + 1]), color, thickness)
-
-def extract_contours(image_path):
+    # sampled in one batch and drawn with a single polylines call, see contourRender
+    contourRender.draw_curves(image, control_points, color, thickness)
+
+def matte_from_frame(frame, matte="alpha"):
+  """
+  Returns the single-channel matte of a decoded frame.
+
+  Parameters:
+      frame: A BGR or BGRA image as returned by cv2.imread / cv2.VideoCapture.read.
+      matte: "alpha" uses the alpha channel, "luma" treats the frame itself as a
+             matte (white silhouette on black), "green" keys out a green screen.
+  """
+  if matte == "alpha":
+    if frame.ndim != 3 or frame.shape[2] != 4:
+      raise ValueError("the alpha matte needs a BGRA frame")
+    return frame[:, :, 3]
+  if matte == "luma":
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+  if matte == "green":
+    hsv = cv2.cvtColor(frame[:, :, :3], cv2.COLOR_BGR2HSV)
+    # everything that is not saturated green counts as foreground
+    return cv2.bitwise_not(cv2.inRange(hsv, (35, 80, 60), (85, 255, 255)))
+  raise ValueError(f"unknown matte mode {matte}")
+
+
+def simplify_contour(points, max_error=4, simplify=0.5):
+  """
+  Shape-preserving decimation of an (N, 2) contour before fitting.
+
+  Runs Douglas-Peucker with a tolerance of simplify * sqrt(max_error) pixels,
+  so every dropped point stays that close to the kept polyline; max_error is
+  fitCurve's squared error bound, and simplify=1 spends the whole bound on the
+  decimation. Edges longer than 4 * sqrt(max_error) are then resampled at that
+  spacing again: fitCurve only checks the error at the points it is given, so
+  a curve fitted through a few far apart points could otherwise bulge away from
+  the outline between them. Returns float points, or points unchanged if there
+  are fewer than 3.
+  """
+  if simplify <= 0 or len(points) < 3:
+    return points
+  tolerance = simplify * np.sqrt(max_error)
+  spacing = 4 * np.sqrt(max_error)
+  kept = cv2.approxPolyDP(points.reshape(-1, 1, 2).astype(np.int32), tolerance, False).reshape(-1, 2).astype(float)
+
+  edges = np.diff(kept, axis=0)
+  steps = np.maximum(1, np.ceil(np.linalg.norm(edges, axis=1) / spacing)).astype(int)
+  edge_idx = np.repeat(np.arange(len(edges)), steps)
+  # position of every resampled point along its edge, 0 for the edge's start point
+  t = (np.arange(len(edge_idx)) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+  resampled = kept[edge_idx] + t[:, np.newaxis] * edges[edge_idx]
+  return np.concatenate([resampled, kept[-1:]])
+
+
+def curves_to_json(curves, label="", group_fallback=False):
+  """
+  Converts an (N, 4, 2) curve array into [[x1,y1,x2,y2,x3,y3,x4,y4], ...] and
+  returns it with the number of curves that had to be replaced by a straight
+  line. Replacement values are appended flat unless group_fallback is set.
+  """
+  curveJsonList = []
+
+  weirdCurveCount = 0
+  if debug:
+    print("num curves in frame: ",len(curves), "for image", label)
+  else:
+    #convert (N, 4, 2) list into json of  [[x1,y1,x2,y2,x3,y3,x4,y4]]
+    for c in range(len(curves)):
+        curve = curves[c]
+        try:
+          curveJson = []
+          for point in curve:
+            #convert numpy int32 into python int
+            curveJson.append(int(point[0]))
+            curveJson.append(int(point[1]))
+          curveJsonList.append(curveJson)
+        except Exception as e:
+          # create a new curve that starts at the and of the last curve, and ends at the start of the next curve
+          lastCurveStart = curves[c-1][-1]
+          nextCurveEnd = curves[c+1 % len(curves)][0]
+          # linspace to create 4 points
+          newCurve = np.linspace(lastCurveStart, nextCurveEnd, 4)
+          newCurveJson = []
+          for point in newCurve:
+            newCurveJson.append(int(point[0]))
+            newCurveJson.append(int(point[1]))
+          if group_fallback:
+            curveJsonList.append(newCurveJson)
+          else:
+            curveJsonList.extend(newCurveJson)
+          # print("replacing curve", curves[c], "with new curve", newCurve)
+          weirdCurveCount += 1
+  return curveJsonList, weirdCurveCount
+
+
+def fit_contour(args):
+  """
+  Fits one contour for extract_contours_from_matte's multi mode; a top-level
+  function of one tuple (points, max_error, simplify, corners) so it can be
+  mapped over a pool. Returns (curves, stats dict).
+  """
+  points, max_error, simplify, corners = args
+  stats = {}
+  if simplify:
+    points = simplify_contour(points, max_error, simplify)
+  if corners:
+    return fitCurves.fitCurveCorners(points, max_error, stats=stats), stats
+  return fitCurves.fitCurve(points, max_error, stats=stats), stats
+
+
+def level_key(max_error):
+  """The key of a level of detail in lod results, e.g. "16" for max error 16.0."""
+  return f"{max_error:g}"
+
+
+def read_alpha_matte(image_path):
+  """Decodes a PNG and returns its alpha channel as a matte."""
+  # Load the image
+  image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+  if image is None:
+    raise ValueError("could not read image")
+
+  # Extract the alpha channel
+  return matte_from_frame(image, "alpha")
+
+
+def _check_fit_options(temporal=False, cached=False, corners=False, multi=False, lod=(), curve_budget=0):
+  """Raises ValueError for fitting options that can't be combined."""
+  if temporal and cached:
+    raise ValueError("temporal fitting can't be combined with a contour cache")
+  if temporal and (corners or multi):
+    raise ValueError("temporal fitting can't be combined with corner splitting or multiple contours")
+  if lod and (temporal or corners or multi):
+    raise ValueError("level of detail fitting can't be combined with temporal, corner or multiple contour fitting")
+  if curve_budget and (temporal or corners or multi or lod):
+    raise ValueError("curve budgets can't be combined with temporal, corner, multiple contour or lod fitting")
+
+
+def extract_contours(image_path, max_error=4, threshold=127, contour_mode=cv2.RETR_EXTERNAL, seed=None,
+                     metrics=None, simplify=0, corners=False, segment_map=map, multi=False, min_area=100,
+                     mask_source=read_alpha_matte, lod=(), curve_budget=0, exact_budget=False):
+  """
+  Fits Bezier curves to the largest contour in the alpha channel of a PNG, see
+  extract_contours_from_matte. If metrics is a dict it is filled with timings
+  and fit statistics for the frame (see contourMetrics).
+
+  mask_source is any callable turning image_path into a matte, e.g. a
+  maskSource.AlphaMaskSource, which reuses its buffer between frames and can
+  skip pixels for preview runs, or functools.partial(matte_from_frame,
+  matte="green") to pass already decoded frames as image_path. A source with
+  a reduce attribute returns mattes that are that many times smaller, and the
+  contour is scaled back up before fitting.
+  """
+  start = time.perf_counter()
   try:
-    # Load the image
-    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-
-    # Extract the alpha channel
-    alpha_channel = image[:, :, 3]
+    alpha_channel = mask_source(image_path)
+  except Exception as e:
+    print("error in extract_contours", image_path if isinstance(image_path, str) else "")
+    print(e)
+    if metrics is not None:
+      metrics["error"] = f"decode: {e}"
+    return []
+  if metrics is not None:
+    metrics["decode_ms"] = 1000 * (time.perf_counter() - start)
+
+  label = image_path if isinstance(image_path, str) else ""
+  contour = extract_contours_from_matte(alpha_channel, max_error, threshold, contour_mode, label=label, seed=seed,
+                                        metrics=metrics, simplify=simplify, corners=corners,
+                                        segment_map=segment_map, multi=multi, min_area=min_area,
+                                        scale=getattr(mask_source, "reduce", 1), lod=lod, curve_budget=curve_budget,
+                                        exact_budget=exact_budget)
+  if metrics is not None:
+    metrics["total_ms"] = 1000 * (time.perf_counter() - start)
+  return contour
+
+
+def extract_contours_from_matte(matte, max_error=4, threshold=127, contour_mode=cv2.RETR_EXTERNAL, label="",
+                                seed=None, metrics=None, simplify=0, corners=False, segment_map=map, multi=False,
+                                min_area=100, scale=1, lod=(), curve_budget=0, exact_budget=False):
+  """
+  Fits Bezier curves to the largest contour of an already decoded matte and
+  returns them as a list of [x1,y1,x2,y2,x3,y3,x4,y4] curves. label names the
+  frame in log messages.
+
+  seed may be the curve list returned for the previous frame; its split points
+  are then reused through fitCurves.fitCurveSeeded, falling back to a full fit
+  when they no longer match the contour.
+
+  simplify > 0 decimates the contour with simplify_contour before fitting.
+
+  corners fits the contour as a closed loop split at its sharp corners with
+  fitCurves.fitCurveCorners, mapping the corner-to-corner runs with
+  segment_map (e.g. Pool.map to fit them in parallel); seed is then ignored.
+
+  multi fits every contour enclosing at least min_area pixels instead of only
+  the longest one, mapping them over segment_map, and returns
+  {"curves": [...], "contours": [[first_curve, curve_count, parent], ...]}:
+  the curves of all contours in findContours order plus one index row per
+  contour. parent is the row of the enclosing contour for holes found with
+  contour_mode=cv2.RETR_CCOMP (or RETR_TREE), -1 for outer contours. seed is
+  ignored.
+
+  scale multiplies the contour points before fitting, for mattes decoded at a
+  reduced resolution; max_error and min_area stay in full resolution pixels.
+
+  lod lists extra max errors to fit the contour at besides max_error, with
+  fitCurves.fitCurveLevels. The result is then
+  {"curves": [...], "levels": {"16": [...], ...}}: the max_error curves,
+  identical to a fit without lod, plus the curves of every extra level keyed
+  by level_key. Coarser levels merge and finer ones refine the max_error fit,
+  so they cost much less than separate fits. seed is ignored, and lod can't
+  be combined with corners or multi.
+
+  curve_budget > 0 fits at most that many curves with
+  fitCurves.fitCurveBudget, merging the cheapest neighbours of the max_error
+  fit; exact_budget also splits the worst curves of frames that need fewer,
+  so every frame has exactly curve_budget curves (weird ones are replaced by
+  a straight line in place). seed is ignored, and curve_budget can't be
+  combined with corners, multi or lod.
+
+  metrics, if a dict, receives the threshold, findContours, fit and serialize
+  times in ms, the fit statistics of fitCurves.fitCurve and, for frames that
+  come back empty, the reason in "error".
+  """
+  _check_fit_options(False, False, corners, multi, lod, curve_budget)
+  stats = {} if metrics is not None else None
+  lap = time.perf_counter()
+  def timed(key):
+    nonlocal lap
+    if metrics is not None:
+      now = time.perf_counter()
+      metrics[key] = 1000 * (now - lap)
+      lap = now
 
-    # Threshold the alpha channel to create a binary mask
-    _, binary_mask = cv2.threshold(alpha_channel, 127, 255, cv2.THRESH_BINARY)
+  try:
+    # Threshold the matte to create a binary mask
+    _, binary_mask = cv2.threshold(matte, threshold, 255, cv2.THRESH_BINARY)
+    timed("threshold_ms")
 
     # Find contours
-    contours, _ = cv2.findContours(binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours, hierarchy = cv2.findContours(binary_mask, contour_mode, cv2.CHAIN_APPROX_SIMPLE)
+    timed("find_contours_ms")
+    if len(contours) == 0:
+      if metrics is not None:
+        metrics["error"] = "no contour"
+      return []
+    if multi:
+      return _fit_all_contours(contours, hierarchy, max_error, min_area, simplify, corners, segment_map, label,
+                               metrics, timed, scale)
 
     #find the longest contour since thats probably what we want
     target_contour = contours[0]
@@ -55,10 +286,40 @@ def extract_contours(image_path):
 
     #convert Sequence[MatLike] into a numpy array of shape (N, 2), reshaping if necessary
     pointList = np.array(target_contour).reshape((-1, 2))
+    if scale != 1:
+      pointList = pointList * scale
+    contourPoints = len(pointList)
+    if simplify:
+      pointList = simplify_contour(pointList, max_error, simplify)
 
     #print shape of pointList
 
-    curves = fitCurves.fitCurve(pointList, 4)
+    curves = None
+    levels = None
+    if corners:
+      curves = fitCurves.fitCurveCorners(pointList, max_error, stats=stats, mapper=segment_map)
+    elif lod:
+      levels = fitCurves.fitCurveLevels(pointList, max_error, lod, stats=stats)
+      curves = levels.pop(max_error)
+    elif curve_budget:
+      curves = fitCurves.fitCurveBudget(pointList, curve_budget, max_error, exact_budget, stats=stats)
+    elif seed:
+      seedPoints = [curve[:2] for curve in seed[1:] if isinstance(curve, list)]
+      curves = fitCurves.fitCurveSeeded(pointList, max_error, seedPoints, stats=stats)
+      if metrics is not None:
+        metrics["seeded"] = curves is not None
+    if curves is None:
+      if stats:
+        # the seeded attempt was thrown away, count only the full fit
+        stats.clear()
+      curves = fitCurves.fitCurve(pointList, max_error, stats=stats)
+    timed("fit_ms")
+    if metrics is not None:
+      if simplify:
+        metrics["simplified_points"] = len(pointList)
+      metrics.update(points=contourPoints, curves=len(curves), splits=stats.get("splits", 0),
+                     reparameterizations=stats.get("reparameterizations", 0),
+                     max_sq_error=stats.get("maxError", 0.0))
 
     if drawContours:
       output = np.zeros_like(binary_mask)
@@ -69,81 +330,490 @@ def extract_contours(image_path):
       cv2.imwrite("contours.png", output)
     # print(curves[0][0])
 
-    curveJsonList = []
-
-    weirdCurveCount = 0
-    if debug:
-      print("num curves in frame: ",len(curves), "for image", image_path)
-    else:
-      #convert (N, 4, 2) list into json of  [[x1,y1,x2,y2,x3,y3,x4,y4]]
-      for c in range(len(curves)):
-          curve = curves[c]
-          try:
-            curveJson = []
-            for point in curve:
-              #convert numpy int32 into python int
-              curveJson.append(int(point[0]))
-              curveJson.append(int(point[1]))
-            curveJsonList.append(curveJson)
-          except Exception as e:
-            # create a new curve that starts at the and of the last curve, and ends at the start of the next curve
-            lastCurveStart = curves[c-1][-1]
-            nextCurveEnd = curves[c+1 % len(curves)][0]
-            # linspace to create 4 points
-            newCurve = np.linspace(lastCurveStart, nextCurveEnd, 4)
-            for point in newCurve:
-              curveJsonList.append(int(point[0]))
-              curveJsonList.append(int(point[1]))
-            # print("replacing curve", curves[c], "with new curve", newCurve)
-            weirdCurveCount += 1
-
+    # a fixed curve count needs the fallback of weird curves kept as one curve
+    curveJsonList, weirdCurveCount = curves_to_json(curves, label, group_fallback=bool(curve_budget))
+    timed("serialize_ms")
+    if metrics is not None:
+      metrics["weird_curves"] = weirdCurveCount
 
     # if there are too many weird curves, return an empty list
     if weirdCurveCount > 5:
+      if metrics is not None:
+        metrics["error"] = f"{weirdCurveCount} weird curves"
       return []
+    elif levels is not None:
+      return {"curves": curveJsonList,
+              "levels": {level_key(error): curves_to_json(levelCurves, label, group_fallback=True)[0]
+                         for error, levelCurves in levels.items()}}
     else:
       return curveJsonList
   
   except Exception as e:
-    print("error in extract_contours", image_path)
+    print("error in extract_contours", label)
     print(e)
+    if metrics is not None:
+      metrics["error"] = f"{type(e).__name__}: {e}"
     return []
 
 
-def extract_contours_from_video_folder(video_folder_path):
-  contourList = []
-  for image_path in sorted(os.listdir(video_folder_path)):
-    # print(image_path)
-    full_image_path = os.path.join(video_folder_path, image_path)
-    contour = extract_contours(full_image_path)
-    if len(contour) > 0:
-      contourList.append(contour)
+def _fit_all_contours(contours, hierarchy, max_error, min_area, simplify, corners, segment_map, label, metrics,
+                      timed, scale=1):
+  # multi mode of extract_contours_from_matte
+  kept = [i for i, c in enumerate(contours) if cv2.contourArea(c) * scale**2 >= min_area]
+  if not kept:
+    if metrics is not None:
+      metrics["error"] = "no contour"
+    return []
+  row = {contour_idx: r for r, contour_idx in enumerate(kept)}
+  fits = list(segment_map(fit_contour, [(np.array(contours[i]).reshape((-1, 2)) * scale, max_error, simplify,
+                                         corners) for i in kept]))
+  timed("fit_ms")
+
+  curveJsonList = []
+  index = []
+  weirdCurveCount = 0
+  for contour_idx, (curves, _) in zip(kept, fits):
+    contourJson, weird = curves_to_json(curves, label, group_fallback=True)
+    # holes whose outer contour was too small to keep become top level
+    parent = row.get(int(hierarchy[0][contour_idx][3]), -1)
+    index.append([len(curveJsonList), len(contourJson), parent])
+    curveJsonList.extend(contourJson)
+    weirdCurveCount += weird
+  timed("serialize_ms")
+
+  if metrics is not None:
+    metrics.update(contours=len(kept), points=int(sum(len(contours[i]) for i in kept)), curves=len(curveJsonList),
+                   splits=sum(stats.get("splits", 0) for _, stats in fits),
+                   reparameterizations=sum(stats.get("reparameterizations", 0) for _, stats in fits),
+                   max_sq_error=max(stats.get("maxError", 0.0) for _, stats in fits),
+                   weird_curves=weirdCurveCount)
+  if weirdCurveCount > 5 * len(kept):
+    if metrics is not None:
+      metrics["error"] = f"{weirdCurveCount} weird curves"
+    return []
+  return {"curves": curveJsonList, "contours": index}
+
+
+def extract_contours_cached(image_path, cache, max_error=4, threshold=127, contour_mode=cv2.RETR_EXTERNAL,
+                            metrics=None, simplify=0, corners=False, segment_map=map, multi=False, min_area=100,
+                            mask_source=read_alpha_matte, lod=(), curve_budget=0, exact_budget=False):
+  """
+  Same as extract_contours, but looks the frame up in a ContourCache first and
+  stores freshly computed results (including empty ones) back into it.
+  """
+  params = dict(max_error=max_error, threshold=threshold, contour_mode=contour_mode)
+  if simplify:
+    # options are only keyed when on, so entries written before they existed stay valid
+    params["simplify"] = simplify
+  if corners:
+    params["corners"] = True
+  if multi:
+    params["multi"] = min_area
+  if lod:
+    params["lod"] = sorted(lod)
+  if curve_budget:
+    params["curve_budget"] = curve_budget
+    params["exact_budget"] = exact_budget
+  if hasattr(mask_source, "cache_params"):
+    params.update(mask_source.cache_params())
+  key = cache.key(image_path, **params)
+  contour = cache.get(key)
+  if contour is None:
+    contour = extract_contours(image_path, max_error, threshold, contour_mode, metrics=metrics, simplify=simplify,
+                               corners=corners, segment_map=segment_map, multi=multi, min_area=min_area,
+                               mask_source=mask_source, lod=lod, curve_budget=curve_budget,
+                               exact_budget=exact_budget)
+    cache.put(key, contour)
+  elif metrics is not None:
+    # multi and lod results are {"curves": [...], ...} dicts
+    metrics.update(cached=True, curves=len(contour["curves"] if isinstance(contour, dict) else contour))
+  return contour
+
+
+def extract_contours_measured(extract, image_path):
+  """Runs extract (extract_contours or a partial of it) and returns (contour, metrics dict)."""
+  metrics = {"frame": os.path.basename(image_path)}
+  return extract(image_path, metrics=metrics), metrics
+
+
+def iter_temporal_contours(image_paths, max_error=4, keyframe_interval=30, with_metrics=False, simplify=0,
+                           mask_source=read_alpha_matte):
+  """
+  Yields the contours of image_paths in order, seeding each frame's fit with the
+  previous frame's split points. Every keyframe_interval frames (and after any
+  failed frame) a full fit is done so the split points can't drift. With
+  with_metrics, yields (contour, metrics dict) pairs instead.
+  """
+  previous = None
+  for i, image_path in enumerate(image_paths):
+    seed = previous if i % keyframe_interval else None
+    metrics = {"frame": os.path.basename(image_path)} if with_metrics else None
+    contour = extract_contours(image_path, max_error, seed=seed, metrics=metrics, simplify=simplify,
+                               mask_source=mask_source)
+    previous = contour or None
+    yield (contour, metrics) if with_metrics else contour
+
+
+def add_frame(video_contours, contour):
+  """
+  Appends one frame's result to a {"frames": [...]} dict, moving the index of
+  multi mode results into its "contours" list and the curves of lod results
+  into {"levels": {key: [frame, ...]}}. Returns False for empty frames, which
+  are left out like everywhere else.
+  """
+  if len(contour) == 0:
+    return False
+  if isinstance(contour, dict):
+    if "contours" in contour:
+      video_contours.setdefault("contours", []).append(contour["contours"])
+    for key, curves in contour.get("levels", {}).items():
+      video_contours.setdefault("levels", {}).setdefault(key, []).append(curves)
+    contour = contour["curves"]
+  video_contours["frames"].append(contour)
+  return True
+
+
+def extract_contours_from_video_folder(video_folder_path, workers=1, chunksize=16, pool=None, cache=None, max_error=4,
+                                       temporal=False, keyframe_interval=30, metrics=None, simplify=0, corners=False,
+                                       parallel_segments=False, multi=False, min_area=100, holes=False, reduce=1,
+                                       lod=(), curve_budget=0, exact_budget=False):
+  """
+  Extracts the contours of every frame in a folder of PNGs, in sorted frame order.
+
+  Parameters:
+      video_folder_path: Folder containing the frames of a single video.
+      workers: Number of worker processes to spread frames over (1 runs serially,
+               None uses every core). Ignored when pool is given.
+      chunksize: Number of frames handed to a worker at a time.
+      pool: An existing multiprocessing.Pool to reuse across videos.
+      cache: Optional ContourCache; only frames whose content or fit parameters
+             changed since the last run are recomputed. Call cache.evict()
+             once done, extract_contours_from_folder_of_videos does.
+      max_error: Max squared error passed to fitCurves.fitCurve.
+      temporal: Warm-start every frame from the previous one's split points, see
+                iter_temporal_contours. Frames then depend on each other, so this
+                always runs serially and ignores workers and pool. Combining it
+                with cache raises ValueError, as seeded fits depend on the
+                previous frame and can't be cached per frame.
+      keyframe_interval: Frames between full fits in temporal mode.
+      metrics: Optional contourMetrics.ContourMetrics that receives a record per
+               frame and a summary for the folder.
+      simplify: Douglas-Peucker tolerance as a fraction of sqrt(max_error), see
+                simplify_contour; 0 fits the raw contour.
+      corners: Fit every contour as a closed loop split at its sharp corners,
+               see fitCurves.fitCurveCorners. Not combinable with temporal.
+      parallel_segments: With corners or multi, fit frames one at a time and
+                         spread each frame's corner-to-corner runs or
+                         contours over the pool instead, for videos of few,
+                         very large or crowded frames.
+      multi: Fit every contour of at least min_area pixels rather than only the
+             longest, see extract_contours_from_matte. The result then also
+             holds "contours": one [[first_curve, curve_count, parent], ...]
+             index per entry of "frames". Not combinable with temporal.
+      holes: With multi, also fit holes (cv2.RETR_CCOMP), each pointing to its
+             outer contour's row through parent.
+      reduce: Fit mattes subsampled by this factor for quick previews, see
+              maskSource.AlphaMaskSource. Curves stay in full resolution
+              coordinates.
+      lod: Extra max errors to fit every frame at, see
+           extract_contours_from_matte. The result then also holds
+           "levels": {key: frames} with one entry per extra level, aligned
+           with "frames" (see split_levels). Not combinable with temporal,
+           corners or multi.
+      curve_budget: Fit at most this many curves per frame (0 = no limit),
+                    see extract_contours_from_matte. Not combinable with
+                    temporal, corners, multi or lod.
+      exact_budget: Give every frame exactly curve_budget curves, so a video
+                    is one (frames, curve_budget, 8) array, see
+                    contourBinary.ContourBinaryReader.fixed_curves.
+  """
+  _check_fit_options(temporal, cache is not None, corners, multi, lod, curve_budget)
+  image_paths = [os.path.join(video_folder_path, image_path) for image_path in sorted(os.listdir(video_folder_path))]
+
+  own_pool = pool is None and workers != 1 and not temporal
+  if own_pool:
+    pool = multiprocessing.Pool(workers)
+  try:
+    # imap hands results back in submission order, so the output matches the serial run
+    # one mask source per worker process (or for the serial run), reusing its buffer across frames
+    options = dict(max_error=max_error, simplify=simplify, corners=corners, multi=multi, min_area=min_area,
+                   contour_mode=cv2.RETR_CCOMP if holes else cv2.RETR_EXTERNAL, mask_source=AlphaMaskSource(reduce),
+                   lod=lod, curve_budget=curve_budget, exact_budget=exact_budget)
+    segment_pool = pool if (corners or multi) and parallel_segments else None
+    if segment_pool is not None:
+      options["segment_map"] = segment_pool.map
+    if cache is None:
+      extract = functools.partial(extract_contours, **options)
     else:
-      print("no contour found or error for", full_image_path)
-  return {"frames": contourList}
-
+      extract = functools.partial(extract_contours_cached, cache=cache, **options)
+    if metrics is not None:
+      extract = functools.partial(extract_contours_measured, extract)
+    if temporal:
+      contours = iter_temporal_contours(image_paths, max_error, keyframe_interval, metrics is not None, simplify,
+                                        options["mask_source"])
+    elif pool is None or segment_pool is not None:
+      contours = map(extract, image_paths)
+    else:
+      contours = pool.imap(extract, image_paths, chunksize)
+
+    video_name = os.path.basename(os.path.normpath(video_folder_path))
+    video_contours = {"frames": []}
+    for full_image_path, contour in zip(image_paths, contours):
+      if metrics is not None:
+        contour, frame_metrics = contour
+        metrics.frame(video_name, frame_metrics)
+      if not add_frame(video_contours, contour):
+        print("no contour found or error for", full_image_path)
+  finally:
+    if own_pool:
+      pool.close()
+      pool.join()
+  if metrics is not None:
+    metrics.video_summary(video_name)
+  return video_contours
+
+
+def iter_contours_from_video_file(video_path, matte="green", size=None, max_error=4, threshold=127,
+                                  contour_mode=cv2.RETR_EXTERNAL, temporal=False, keyframe_interval=30, metrics=None,
+                                  simplify=0, corners=False, multi=False, min_area=100, lod=(), curve_budget=0,
+                                  exact_budget=False):
+  """
+  Decodes a video with cv2.VideoCapture and yields (frame_index, curves) for every
+  frame, building the matte in memory instead of round-tripping through PNGs.
+
+  Parameters:
+      video_path: Path to the video file.
+      matte: How to build the matte from each frame, "luma" or "green", see
+             matte_from_frame. cv2.VideoCapture always decodes to BGR, so
+             "alpha" is rejected.
+      size: Optional (width, height) to resize frames to before fitting, e.g.
+            (960, 540) to match the frames written by process_video_pngs.scale_pngs.
+      temporal: Seed each frame's fit with the previous frame's split points,
+                doing a full fit every keyframe_interval frames.
+      metrics: Optional contourMetrics.ContourMetrics receiving a record per
+               frame; decode_ms covers reading, resizing and building the matte.
+      simplify: Contour decimation before fitting, see simplify_contour.
+      corners: Fit closed loops split at sharp corners instead; ignores temporal.
+      multi: Fit every contour of at least min_area pixels, see
+             extract_contours_from_matte; ignores temporal. Pass
+             contour_mode=cv2.RETR_CCOMP to include holes.
+      lod: Extra max errors to fit every frame at, see
+           extract_contours_from_matte; ignores temporal.
+      curve_budget, exact_budget: Fixed or maximum curve counts per frame,
+                                  see extract_contours_from_matte; ignore
+                                  temporal.
+  """
+  if matte == "alpha":
+    raise ValueError(f"cannot use the alpha matte for {video_path}: video frames are decoded without alpha")
+  cap = cv2.VideoCapture(video_path)
+  if not cap.isOpened():
+    raise RuntimeError(f"Cannot open video file {video_path}")
 
-def extract_contours_from_folder_of_videos(folder_path):
+  try:
+    frame_idx = 0
+    previous = None
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    while True:
+      start = time.perf_counter()
+      ret, frame = cap.read()
+      if not ret:
+        break
+      if size is not None:
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+      frame_matte = matte_from_frame(frame, matte)
+      frame_metrics = None
+      if metrics is not None:
+        frame_metrics = {"frame": frame_idx, "decode_ms": 1000 * (time.perf_counter() - start)}
+      seed = previous if temporal and frame_idx % keyframe_interval else None
+      contour = extract_contours_from_matte(frame_matte, max_error, threshold, contour_mode,
+                                            f"{video_path} frame {frame_idx}", seed, frame_metrics, simplify, corners,
+                                            multi=multi, min_area=min_area, lod=lod, curve_budget=curve_budget,
+                                            exact_budget=exact_budget)
+      if metrics is not None:
+        frame_metrics["total_ms"] = 1000 * (time.perf_counter() - start)
+        metrics.frame(video_name, frame_metrics)
+      previous = contour or None
+      yield frame_idx, contour
+      frame_idx += 1
+  finally:
+    cap.release()
+    if metrics is not None:
+      metrics.video_summary(video_name)
+
+
+def extract_contours_from_video_file(video_path, matte="green", size=None, max_error=4, temporal=False,
+                                     keyframe_interval=30, metrics=None, simplify=0, corners=False, multi=False,
+                                     min_area=100, holes=False, lod=(), curve_budget=0, exact_budget=False):
+  """Same output as extract_contours_from_video_folder, streamed straight from a video file."""
+  _check_fit_options(temporal, False, corners, multi, lod, curve_budget)
+  video_contours = {"frames": []}
+  for frame_idx, contour in iter_contours_from_video_file(video_path, matte, size, max_error,
+                                                          contour_mode=cv2.RETR_CCOMP if holes else cv2.RETR_EXTERNAL,
+                                                          temporal=temporal, keyframe_interval=keyframe_interval,
+                                                          metrics=metrics, simplify=simplify, corners=corners,
+                                                          multi=multi, min_area=min_area, lod=lod,
+                                                          curve_budget=curve_budget, exact_budget=exact_budget):
+    if not add_frame(video_contours, contour):
+      print("no contour found or error for", video_path, "frame", frame_idx)
+  return video_contours
+
+
+def extract_contours_from_folder_of_videos(folder_path, workers=1, chunksize=16, cache=None, max_error=4,
+                                           stream_videos=False, matte="green", size=None, temporal=False,
+                                           keyframe_interval=30, metrics=None, simplify=0, corners=False,
+                                           parallel_segments=False, multi=False, min_area=100, holes=False, reduce=1,
+                                           lod=(), curve_budget=0, exact_budget=False):
+  """
+  Extracts contours for every subfolder of PNG frames in folder_path. With
+  stream_videos, video files found next to the subfolders are streamed with
+  extract_contours_from_video_file (using matte and size) and keyed by their
+  name without extension; otherwise they are skipped like any other file.
+  metrics is an optional contourMetrics.ContourMetrics shared by all videos,
+  simplify is passed on to simplify_contour; corners, parallel_segments,
+  multi, min_area, holes, reduce, lod, curve_budget and exact_budget to
+  extract_contours_from_video_folder
+  (streamed videos fit serially and ignore reduce, use size instead).
+  """
+  _check_fit_options(temporal, cache is not None, corners, multi, lod, curve_budget)
   all_video_contours = {}
-  for video_path in os.listdir(folder_path):
-    video_folder_path = os.path.join(folder_path, video_path)
-    #if not a directory, skip
-    if not os.path.isdir(video_folder_path):
-      print("skipping", video_folder_path)
-      continue
-    print("starting",video_path)
-    
-    video_contours = extract_contours_from_video_folder(video_folder_path)
-    all_video_contours[video_path] = video_contours
-    print(video_path, "finished with num frames", len(video_contours['frames']))
+  # one pool shared by every video so workers are only started once; temporal
+  # fits run serially and never use it
+  pool = multiprocessing.Pool(workers) if workers != 1 and not temporal else None
+  try:
+    for video_path in os.listdir(folder_path):
+      video_folder_path = os.path.join(folder_path, video_path)
+      video_name, ext = os.path.splitext(video_path)
+      # hidden entries hold bookkeeping, e.g. stage_runner's completion markers
+      if video_path.startswith("."):
+        continue
+      if stream_videos and os.path.isfile(video_folder_path) and ext.lower() in VIDEO_EXTENSIONS:
+        print("streaming", video_path, "with", matte, "matte")
+        video_contours = extract_contours_from_video_file(video_folder_path, matte, size, max_error, temporal,
+                                                          keyframe_interval, metrics, simplify, corners, multi,
+                                                          min_area, holes, lod, curve_budget, exact_budget)
+        all_video_contours[video_name] = video_contours
+        print(video_path, "finished with num frames", len(video_contours['frames']))
+        continue
+      #if not a directory, skip
+      if not os.path.isdir(video_folder_path):
+        print("skipping", video_folder_path)
+        continue
+      print("starting",video_path)
+
+      video_contours = extract_contours_from_video_folder(video_folder_path, chunksize=chunksize, pool=pool,
+                                                          cache=cache, max_error=max_error, temporal=temporal,
+                                                          keyframe_interval=keyframe_interval, metrics=metrics,
+                                                          simplify=simplify, corners=corners,
+                                                          parallel_segments=parallel_segments, multi=multi,
+                                                          min_area=min_area, holes=holes, reduce=reduce, lod=lod,
+                                                          curve_budget=curve_budget, exact_budget=exact_budget)
+      all_video_contours[video_path] = video_contours
+      print(video_path, "finished with num frames", len(video_contours['frames']))
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+  # evicting walks the whole cache, so only do it once per run
+  if cache is not None:
+    cache.evict()
   return all_video_contours
 
 
+def split_levels(all_video_contours):
+  """
+  Splits the "levels" of lod results off an all_video_contours dict. Returns
+  the dict without them and {key: {video: {"frames": [...]}}}, one
+  all_video_contours.json style dict per level, coarsest level first, so
+  every level can be saved and loaded on its own.
+  """
+  contours = {}
+  levels = {}
+  for video, video_contours in all_video_contours.items():
+    video_contours = dict(video_contours)
+    for key, frames in video_contours.pop("levels", {}).items():
+      levels.setdefault(key, {})[video] = {"frames": frames}
+    contours[video] = video_contours
+  return contours, dict(sorted(levels.items(), key=lambda item: -float(item[0])))
+
+
 if __name__ == "__main__":
-  #  #get video folder from cmd line arg
-  videos_folder_path = sys.argv[1]
-  all_video_contours = extract_contours_from_folder_of_videos(videos_folder_path)
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Fit Bezier contours to every frame of a folder of PNG frame folders.")
+  parser.add_argument("videos_folder_path", help="Folder containing one subfolder of PNG frames (or, with --stream-videos, one video file) per video.")
+  parser.add_argument("--workers", type=int, default=1,
+                      help="Number of worker processes (default 1 runs serially, 0 uses every core).")
+  parser.add_argument("--chunksize", type=int, default=16, help="Frames handed to a worker at a time.")
+  parser.add_argument("--cache-dir", default=None, help="Reuse fits of unchanged frames from this cache folder.")
+  parser.add_argument("--cache-max-mb", type=int, default=1024, help="Size limit of the cache folder in MB.")
+  parser.add_argument("--stream-videos", action="store_true",
+                      help="Also fit video files found in the folder, decoding them directly instead of from PNGs.")
+  parser.add_argument("--matte", choices=["luma", "green"], default="green",
+                      help="How to build the matte for --stream-videos.")
+  parser.add_argument("--size", type=int, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"),
+                      help="Resize --stream-videos frames before fitting, e.g. 960 540.")
+  parser.add_argument("--temporal", action="store_true",
+                      help="Warm-start each frame's fit from the previous frame's split points.")
+  parser.add_argument("--keyframe-interval", type=int, default=30, help="Frames between full fits in --temporal mode.")
+  parser.add_argument("--metrics", default=None, metavar="JSONL",
+                      help="Write per-frame timings and fit statistics plus per-video summaries to this JSONL file.")
+  parser.add_argument("--simplify", type=float, default=0, metavar="FRACTION",
+                      help="Douglas-Peucker the contour before fitting, with a tolerance of FRACTION * sqrt(max error) "
+                           "pixels (0 = off). See benchmark_fitting.py --simplify-report for the accuracy trade-off.")
+  parser.add_argument("--corners", action="store_true",
+                      help="Fit each contour as a closed loop split at its sharp corners.")
+  parser.add_argument("--multi", action="store_true",
+                      help="Fit every contour of at least --min-area pixels instead of only the longest one; the "
+                           "output then also holds a per-frame \"contours\" index.")
+  parser.add_argument("--min-area", type=float, default=100, help="Smallest contour area in pixels fitted by --multi.")
+  parser.add_argument("--holes", action="store_true", help="With --multi, also fit the holes inside contours.")
+  parser.add_argument("--preview-reduce", type=int, default=1, metavar="N",
+                      help="Fit every N-th pixel of each PNG matte in both directions for a quick preview run.")
+  parser.add_argument("--lod", type=float, nargs="+", default=(), metavar="MAX_ERROR",
+                      help="Also fit every frame at these max errors, e.g. 16 8 2, and write each level to "
+                           "all_video_contours_lod<MAX_ERROR>.json, so viewers can load a coarse level first.")
+  parser.add_argument("--curve-budget", type=int, default=0, metavar="N",
+                      help="Fit at most N curves per frame, merging the neighbours that fit together best.")
+  parser.add_argument("--exact-budget", action="store_true",
+                      help="With --curve-budget, split curves of frames that need fewer so every frame has exactly N.")
+  parser.add_argument("--parallel-segments", action="store_true",
+                      help="With --corners or --multi, spread each frame's corner-to-corner runs or contours over the "
+                           "workers instead of whole frames; for a few very high resolution frames.")
+  args = parser.parse_args()
+  try:
+    _check_fit_options(args.temporal, bool(args.cache_dir), args.corners, args.multi, args.lod, args.curve_budget)
+  except ValueError as e:
+    parser.error(str(e))
+  if args.parallel_segments and not (args.corners or args.multi):
+    parser.error("--parallel-segments needs --corners or --multi")
+  if args.holes and not args.multi:
+    parser.error("--holes needs --multi")
+  if args.exact_budget and not args.curve_budget:
+    parser.error("--exact-budget needs --curve-budget")
+
+  cache = ContourCache(args.cache_dir, args.cache_max_mb << 20) if args.cache_dir else None
+  metrics = ContourMetrics(args.metrics) if args.metrics else None
+  try:
+    all_video_contours = extract_contours_from_folder_of_videos(args.videos_folder_path, args.workers or None,
+                                                                args.chunksize, cache,
+                                                                stream_videos=args.stream_videos, matte=args.matte,
+                                                                size=tuple(args.size) if args.size else None,
+                                                                temporal=args.temporal,
+                                                                keyframe_interval=args.keyframe_interval,
+                                                                metrics=metrics, simplify=args.simplify,
+                                                                corners=args.corners,
+                                                                parallel_segments=args.parallel_segments,
+                                                                multi=args.multi, min_area=args.min_area,
+                                                                holes=args.holes, reduce=args.preview_reduce,
+                                                                lod=args.lod, curve_budget=args.curve_budget,
+                                                                exact_budget=args.exact_budget)
+  finally:
+    if metrics is not None:
+      metrics.close()
+  all_video_contours, levels = split_levels(all_video_contours)
   json.dump(all_video_contours, open("all_video_contours.json", "w"))
+  for key, level_contours in levels.items():
+    json.dump(level_contours, open(f"all_video_contours_lod{key}.json", "w"))
 
   # # has error with fitCurve() max error = 1
   # test_path = 'vids/MUTEK_raw/short_540/kurush_540/00025.png'
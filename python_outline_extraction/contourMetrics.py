@@ -0,0 +1,69 @@
+import json
+import numpy as np
+
+# per-frame keys filled in by contourExtract.extract_contours(metrics=...)
+TIMING_KEYS = ("decode_ms", "threshold_ms", "find_contours_ms", "fit_ms", "serialize_ms", "total_ms")
+
+
+class ContourMetrics:
+  """
+  JSONL sidecar for contour extraction statistics.
+
+  Every frame becomes one {"type": "frame", "video": ..., ...} line holding the
+  metrics dict filled in by contourExtract (stage timings in ms, number of
+  contours in multi mode, contour points, simplified_points when simplification is on, curves, fitCubic
+  splits and reparameterization iterations, the largest accepted squared
+  error, weird curve count, and "error" with the reason for frames that came
+  back empty). video_summary() appends one {"type": "video", ...} line
+  aggregating a video's frames and prints it.
+  """
+
+  def __init__(self, path, slowest=5):
+    self.path = path
+    self.slowest = slowest
+    self._file = open(path, "w")
+    self._frames = {}
+
+  def frame(self, video, metrics):
+    record = dict(metrics, type="frame", video=video)
+    self._file.write(json.dumps(record) + "\n")
+    self._frames.setdefault(video, []).append(record)
+
+  def video_summary(self, video):
+    frames = self._frames.pop(video, [])
+    fitted = [f for f in frames if "fit_ms" in f]
+    failures = {}
+    for f in frames:
+      if "error" in f:
+        reason = f["error"].split(":")[0]
+        failures[reason] = failures.get(reason, 0) + 1
+
+    summary = {"type": "video", "video": video, "frames": len(frames), "fitted": len(fitted),
+               "cached": sum(1 for f in frames if f.get("cached")), "failed": sum(failures.values()),
+               "failures": failures}
+    for key in TIMING_KEYS:
+      values = np.array([f[key] for f in frames if key in f])
+      if len(values):
+        summary[key] = {"total": float(values.sum()), "mean": float(values.mean()),
+                        "p95": float(np.percentile(values, 95)), "max": float(values.max())}
+    for key in ("contours", "points", "simplified_points", "curves", "splits", "reparameterizations"):
+      values = [f[key] for f in fitted if key in f]
+      if values:
+        summary[key] = {"total": int(sum(values)), "mean": float(np.mean(values)), "max": int(max(values))}
+    if fitted:
+      summary["max_sq_error"] = max(f.get("max_sq_error", 0.0) for f in fitted)
+      summary["slowest"] = [{"frame": f["frame"], "fit_ms": f["fit_ms"]}
+                            for f in sorted(fitted, key=lambda f: -f["fit_ms"])[:self.slowest]]
+
+    self._file.write(json.dumps(summary) + "\n")
+    self._file.flush()
+    fit = summary.get("fit_ms", {})
+    print(f"[metrics] {video}: {summary['frames']} frames, {summary['failed']} failed, "
+          f"fit {fit.get('mean', 0):.1f} ms mean / {fit.get('max', 0):.1f} ms max, "
+          f"{summary.get('splits', {}).get('total', 0)} splits")
+    return summary
+
+  def close(self):
+    for video in list(self._frames):
+      self.video_summary(video)
+    self._file.close()
@@ -0,0 +1,115 @@
+"""
+Fast drawing of fitted contours, for debugging fits frame by frame or as
+overlay videos of whole clips.
+
+Every frame is sampled with one Bernstein matrix product (bezier.qBatch) and
+drawn with a single cv2.polylines call, one closed polyline per contour.
+"""
+import os
+import sys
+import json
+import cv2
+import numpy as np
+import bezier
+from contourBinary import frame_array
+
+# fixed point bits handed to cv2.polylines, so samples keep subpixel positions
+SHIFT = 4
+
+
+def curve_polylines(curves, contours=None, samples_per_curve=20):
+  """
+  Samples an (N, 4, 2) or (N, 8) curve array into closed int32 polylines for
+  cv2.polylines, in SHIFT fixed point. contours holds the
+  [first_curve, curve_count, parent] rows of a multi-contour frame; without it
+  all curves form one outline.
+  """
+  curves = np.asarray(curves, dtype=float).reshape((-1, 4, 2))
+  if len(curves) == 0:
+    return []
+  # the last sample of a curve is the first of the next one, polylines closes the loop
+  t = np.linspace(0, 1, samples_per_curve + 1)[:-1]
+  points = np.round(bezier.qBatch(curves, t) * (1 << SHIFT)).astype(np.int32)
+  if contours is None:
+    contours = [(0, len(curves), -1)]
+  return [points[first:first + count].reshape((-1, 1, 2)) for first, count, _ in contours if count]
+
+
+def draw_curves(image, curves, color=(255, 0, 0), thickness=5, contours=None, samples_per_curve=20):
+  """Draws the curves of one frame onto image in place, see curve_polylines."""
+  polylines = curve_polylines(curves, contours, samples_per_curve)
+  if polylines:
+    cv2.polylines(image, polylines, True, color, thickness, cv2.LINE_AA, SHIFT)
+  return image
+
+
+def render_video(video_contours, output_path, size=(960, 540), fps=30, frame_paths=None, color=(0, 0, 255),
+                 thickness=2, samples_per_curve=20):
+  """
+  Writes an overlay video of one {"frames": [...], "contours": [...]} entry of
+  all_video_contours.json. frame_paths optionally lists the frame images to
+  draw on (RGBA frames are shown over black); otherwise the curves are drawn
+  on black frames of the given (width, height). Returns the number of frames
+  written.
+  """
+  writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+  if not writer.isOpened():
+    raise ValueError(f"could not open {output_path} for writing")
+  blank = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+  contour_index = video_contours.get("contours")
+  try:
+    for i, frame in enumerate(video_contours["frames"]):
+      image = blank.copy()
+      if frame_paths is not None and i < len(frame_paths):
+        background = cv2.imread(frame_paths[i], cv2.IMREAD_UNCHANGED)
+        if background is not None:
+          if background.ndim == 3 and background.shape[2] == 4:
+            background = cv2.multiply(background[:, :, :3], cv2.merge([background[:, :, 3]] * 3), scale=1 / 255)
+          elif background.ndim == 2:
+            background = cv2.cvtColor(background, cv2.COLOR_GRAY2BGR)
+          image = cv2.resize(background, size) if background.shape[1::-1] != tuple(size) else background
+      draw_curves(image, frame_array(frame), color, thickness,
+                  contour_index[i] if contour_index is not None else None, samples_per_curve)
+      writer.write(image)
+    return len(video_contours["frames"])
+  finally:
+    writer.release()
+
+
+def render_all_videos(all_video_contours, output_folder, frames_root=None, videos=None, **kwargs):
+  """
+  Writes <output_folder>/<video>.mp4 for every video (or the named ones) of
+  an all_video_contours.json dict, drawn on the PNG frames in
+  <frames_root>/<video> when frames_root is given. kwargs go to render_video.
+  """
+  os.makedirs(output_folder, exist_ok=True)
+  for video in videos or sorted(all_video_contours):
+    frame_paths = None
+    if frames_root is not None:
+      folder = os.path.join(frames_root, video)
+      frame_paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".png"))
+    output_path = os.path.join(output_folder, video + ".mp4")
+    count = render_video(all_video_contours[video], output_path, frame_paths=frame_paths, **kwargs)
+    print(f"Wrote {count} frames to {output_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Render fitted contours as overlay videos, one per video.")
+  parser.add_argument("contours", help="all_video_contours.json")
+  parser.add_argument("output_folder", help="Folder for the <video>.mp4 files.")
+  parser.add_argument("--frames-root", default=None,
+                      help="Folder of per-video PNG frame folders to draw on (default: black frames).")
+  parser.add_argument("--videos", nargs="+", default=None, help="Videos to render (default: all).")
+  parser.add_argument("--size", type=int, nargs=2, default=(960, 540), metavar=("WIDTH", "HEIGHT"),
+                      help="Output size; frames are resized to it.")
+  parser.add_argument("--fps", type=float, default=30)
+  parser.add_argument("--thickness", type=int, default=2)
+  parser.add_argument("--samples-per-curve", type=int, default=20)
+  args = parser.parse_args()
+
+  with open(args.contours) as f:
+    all_video_contours = json.load(f)
+  render_all_videos(all_video_contours, args.output_folder, args.frames_root, args.videos, size=tuple(args.size),
+                    fps=args.fps, thickness=args.thickness, samples_per_curve=args.samples_per_curve)
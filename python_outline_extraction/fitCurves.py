@@ -7,20 +7,377 @@ from __future__ import print_function
 from numpy import *
 import bezier
 
+# generateBezier treats C as singular when |det C| <= SINGULAR_TOLERANCE * C00 * C11
+SINGULAR_TOLERANCE = 1.0e-12
+
+# Fit one (ore more) Bezier curves to a set of points, returned as an
+# (N, 4, 2) float array of control points
+# newtonIterations > 1 runs several Newton steps on the parameters before each
+# refit, stopping early once no parameter moves by more than newtonTolerance
+# stats, if given a dict, is updated with the number of 'splits' and
+# 'reparameterizations' done and the largest squared error of an accepted
+# curve ('maxError')
+def fitCurve(points, maxError, newtonIterations=1, newtonTolerance=1.0e-6, stats=None):
+    leftTangent = normalize(points[1] - points[0])
+    rightTangent = normalize(points[-2] - points[-1])
+    return fitCubic(points, leftTangent, rightTangent, maxError, newtonIterations, newtonTolerance, stats)
+
+
+def countStat(stats, key, n=1):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + n
+
+
+# ranges, if given a list, receives the (first, last, leftTangent, rightTangent)
+# point range and end tangents of every returned curve
+def fitCubic(points, leftTangent, rightTangent, error, newtonIterations=1, newtonTolerance=1.0e-6, stats=None,
+             ranges=None):
+    # Work through an explicit stack of (first, last) index ranges into the
+    # shared point array instead of recursing on copied slices. Ranges are
+    # pushed right-then-left so curves come out in contour order.
+    beziers = zeros((64, 4, 2))
+    count = 0
+    stack = [(0, len(points)-1, leftTangent, rightTangent)]
+    while stack:
+        first, last, leftTangent, rightTangent = stack.pop()
+        bezCurve, splitPoint = fitSingleCubic(points[first:last+1], leftTangent, rightTangent, error,
+                                              newtonIterations, newtonTolerance, stats)
+        # Degenerate input (repeated points, NaN tangents) can give a non-finite
+        # error or a split at an end point, which would push the same range
+        # again forever -- emit the two-point heuristic curve instead
+        if bezCurve is None and (splitPoint is None or not 0 < splitPoint < last-first):
+            dist = linalg.norm(points[first] - points[last]) / 3.0
+            bezCurve = [points[first], points[first] + leftTangent * dist, points[last] + rightTangent * dist, points[last]]
+        if bezCurve is not None:
+            if count == len(beziers):
+                beziers = concatenate((beziers, zeros_like(beziers)))
+            beziers[count] = bezCurve
+            count += 1
+            if ranges is not None:
+                ranges.append((first, last, leftTangent, rightTangent))
+            continue
+
+        # Fitting failed -- split at max error point and fit both halves
+        countStat(stats, 'splits')
+        splitPoint += first
+        centerTangent = splitTangent(points, splitPoint)
+        stack.append((splitPoint, last, -centerTangent, rightTangent))
+        stack.append((first, splitPoint, leftTangent, centerTangent))
+
+    return beziers[:count]
+
+
+# Fit points at maxError plus every tolerance of levelErrors, returning a dict
+# mapping each tolerance to its (N, 4, 2) curves. The maxError fit is exactly
+# fitCurve's; coarser levels merge neighbouring curves of the next finer level
+# and finer levels refit only the curves of the next coarser level that fail
+# their tolerance, so every level's split points are a superset of the coarser
+# levels' and the expensive long-span fits are done once.
+def fitCurveLevels(points, maxError, levelErrors, newtonIterations=1, newtonTolerance=1.0e-6, stats=None):
+    ranges = []
+    base = fitCubic(points, normalize(points[1] - points[0]), normalize(points[-2] - points[-1]), maxError,
+                    newtonIterations, newtonTolerance, stats, ranges)
+    levels = {maxError: base}
+    beziers, levelRanges = base, ranges
+    for error in sorted(e for e in levelErrors if e > maxError):
+        beziers, levelRanges = mergeCurves(points, beziers, levelRanges, error)
+        levels[error] = beziers
+    beziers, levelRanges = base, ranges
+    for error in sorted((e for e in levelErrors if e < maxError), reverse=True):
+        beziers, levelRanges = refineCurves(points, beziers, levelRanges, error, newtonIterations, newtonTolerance,
+                                            stats)
+        levels[error] = beziers
+    return levels
+
+
+# Greedily replace pairs of neighbouring curves by one cubic through both point
+# ranges, keeping their outer tangents, until no pair fits within maxError.
+# Only the least squares fit is tried, no reparameterization.
+def mergeCurves(points, beziers, ranges, maxError):
+    beziers = list(beziers)
+    ranges = list(ranges)
+    # pairs that didn't fit, so later passes don't try them again
+    failed = set()
+    merged = True
+    while merged:
+        merged = False
+        mergedBeziers = []
+        mergedRanges = []
+        i = 0
+        while i < len(ranges):
+            if i+1 < len(ranges) and (ranges[i][0], ranges[i+1][1]) not in failed:
+                first, _, leftTangent, _ = ranges[i]
+                _, last, _, rightTangent = ranges[i+1]
+                segment = points[first:last+1]
+                u = chordLengthParameterize(segment)
+                bezCurve = generateBezier(segment, u, leftTangent, rightTangent)
+                if computeMaxError(segment, bezCurve, u)[0] < maxError:
+                    mergedBeziers.append(array(bezCurve, dtype=float))
+                    mergedRanges.append((first, last, leftTangent, rightTangent))
+                    merged = True
+                    i += 2
+                    continue
+                failed.add((first, last))
+            mergedBeziers.append(beziers[i])
+            mergedRanges.append(ranges[i])
+            i += 1
+        beziers, ranges = mergedBeziers, mergedRanges
+    return array(beziers).reshape((-1, 4, 2)), ranges
+
+
+# Refit the curves (with their point ranges and end tangents from fitCubic's
+# ranges) that don't meet the smaller maxError, keeping the others.
+def refineCurves(points, beziers, ranges, maxError, newtonIterations=1, newtonTolerance=1.0e-6, stats=None):
+    refined = []
+    refinedRanges = []
+    for (first, last, leftTangent, rightTangent), bezCurve in zip(ranges, beziers):
+        segment = points[first:last+1]
+        if len(segment) > 2 and computeMaxError(segment, bezCurve, chordLengthParameterize(segment))[0] < maxError:
+            refined.append(bezCurve[newaxis])
+            refinedRanges.append((first, last, leftTangent, rightTangent))
+            continue
+        segmentRanges = []
+        refined.append(fitCubic(segment, leftTangent, rightTangent, maxError, newtonIterations, newtonTolerance,
+                                stats, segmentRanges))
+        refinedRanges.extend((first + a, first + b, left, right) for a, b, left, right in segmentRanges)
+    return concatenate(refined), refinedRanges
+
+
+# Fit points with numCurves curves (at most numCurves unless exact). The
+# contour is fitted at maxError first; while there are too many curves, the
+# neighbouring pair whose merged cubic has the smallest error is merged, and
+# with exact, while there are too few, the curve with the largest error is
+# split at its worst point. Merged and split curves are single least squares
+# fits with the tangents of their neighbours, so the result stays G1 wherever
+# the maxError fit was. stats['maxError'] covers the merged and split curves.
+def fitCurveBudget(points, numCurves, maxError=4, exact=False, newtonIterations=1, newtonTolerance=1.0e-6,
+                   stats=None):
+    if numCurves < 1:
+        raise ValueError("numCurves must be at least 1")
+    ranges = []
+    beziers = list(fitCubic(points, normalize(points[1] - points[0]), normalize(points[-2] - points[-1]), maxError,
+                            newtonIterations, newtonTolerance, stats, ranges))
+
+    def fitRange(first, last, leftTangent, rightTangent):
+        segment = points[first:last+1]
+        u = chordLengthParameterize(segment)
+        bezCurve = array(generateBezier(segment, u, leftTangent, rightTangent), dtype=float)
+        error, splitPoint = computeMaxError(segment, bezCurve, u)
+        return bezCurve, error, splitPoint
+
+    def mergeCost(i):
+        first, _, leftTangent, _ = ranges[i]
+        _, last, _, rightTangent = ranges[i+1]
+        return fitRange(first, last, leftTangent, rightTangent)
+
+    if len(beziers) > numCurves:
+        merges = [mergeCost(i) for i in range(len(beziers)-1)]
+        while len(beziers) > numCurves:
+            i = int(argmin([error for _, error, _ in merges]))
+            bezCurve, error, _ = merges[i]
+            recordError(stats, error)
+            beziers[i:i+2] = [bezCurve]
+            ranges[i:i+2] = [(ranges[i][0], ranges[i+1][1], ranges[i][2], ranges[i+1][3])]
+            del merges[i]
+            if i > 0:
+                merges[i-1] = mergeCost(i-1)
+            if i < len(merges):
+                merges[i] = mergeCost(i)
+
+    if exact and len(beziers) < numCurves:
+        fits = [fitRange(*r) if r[1]-r[0] > 1 else (None, 0.0, None) for r in ranges]
+        while len(beziers) < numCurves:
+            splittable = [i for i, r in enumerate(ranges) if r[1]-r[0] > 1]
+            if not splittable:
+                # fewer contour points than curves: halve the longest curve, which doesn't change its shape
+                i = int(argmax([linalg.norm(b[3] - b[0]) for b in beziers]))
+                b = beziers[i]
+                mid = bezier.q(b, 0.5)
+                beziers[i:i+1] = [array([b[0], (b[0]+b[1])/2, (b[0]+2*b[1]+b[2])/4, mid]),
+                                  array([mid, (b[1]+2*b[2]+b[3])/4, (b[2]+b[3])/2, b[3]])]
+                ranges[i:i+1] = [ranges[i]] * 2
+                fits[i:i+1] = [(None, 0.0, None)] * 2
+                continue
+            i = splittable[int(argmax([fits[i][1] for i in splittable]))]
+            first, last, leftTangent, rightTangent = ranges[i]
+            splitPoint = fits[i][2]
+            if not 0 < splitPoint < last-first:
+                splitPoint = (last-first) // 2
+            splitPoint += first
+            countStat(stats, 'splits')
+            centerTangent = splitTangent(points, splitPoint)
+            halves = [(first, splitPoint, leftTangent, centerTangent), (splitPoint, last, -centerTangent, rightTangent)]
+            halfFits = [fitRange(*r) for r in halves]
+            for _, error, _ in halfFits:
+                recordError(stats, error)
+            beziers[i:i+1] = [bezCurve for bezCurve, _, _ in halfFits]
+            ranges[i:i+1] = halves
+            fits[i:i+1] = [f if r[1]-r[0] > 1 else (None, 0.0, None) for f, r in zip(halfFits, halves)]
+
+    return array(beziers).reshape((-1, 4, 2))
+
+
+# Fit points reusing split points from a similar contour (e.g. the previous
+# video frame). seedPoints are the (K, 2) interior split positions of that fit;
+# each is mapped to the nearest contour point, and seeds that would land out of
+# order are dropped. Adjacent seeded segments are merged whenever one cubic
+# already fits both, every other segment is fitted with a single cubic, and
+# only segments whose error exceeds maxError are subdivided further. Returns
+# None when no seed maps onto the contour or more than maxRefitFraction of the
+# segments needed refitting, in which case the caller should use fitCurve.
+# Only the split points are reused, not the previous parameterization: the
+# seed comes from the previous frame's output curves, which keep no u values,
+# and each segment's chord length start is cheap next to the split search
+# that seeding saves, so every segment is parameterized afresh.
+def fitCurveSeeded(points, maxError, seedPoints, maxRefitFraction=0.25, newtonIterations=1, newtonTolerance=1.0e-6,
+                   stats=None):
+    seedPoints = asarray(seedPoints, dtype=float).reshape((-1, 2))
+    if len(seedPoints) == 0 or len(points) < 4:
+        return None
+
+    dists = ((points[newaxis, :, :] - seedPoints[:, newaxis, :])**2).sum(axis=2)
+    splits = [0]
+    for index in dists.argmin(axis=1):
+        if splits[-1] < index < len(points)-1:
+            splits.append(index)
+    splits.append(len(points)-1)
+    if len(splits) == 2:
+        return None
 
-# Fit one (ore more) Bezier curves to a set of points
-def fitCurve(points, maxError):
     leftTangent = normalize(points[1] - points[0])
     rightTangent = normalize(points[-2] - points[-1])
-    return fitCubic(points, leftTangent, rightTangent, maxError)
 
+    def tangents(first, last):
+        left = leftTangent if first == 0 else -splitTangent(points, first)
+        right = rightTangent if last == len(points)-1 else splitTangent(points, last)
+        return left, right
+
+    beziers = []
+    refitted = 0
+    i = 0
+    while i < len(splits)-1:
+        # try to span two seeded segments with one cubic, without reparameterization
+        if i+2 < len(splits):
+            first, last = splits[i], splits[i+2]
+            left, right = tangents(first, last)
+            segment = points[first:last+1]
+            u = chordLengthParameterize(segment)
+            bezCurve = generateBezier(segment, u, left, right)
+            mergeError = computeMaxError(segment, bezCurve, u)[0]
+            if mergeError < maxError:
+                recordError(stats, mergeError)
+                beziers.append(array(bezCurve, dtype=float)[newaxis])
+                i += 2
+                continue
+
+        first, last = splits[i], splits[i+1]
+        left, right = tangents(first, last)
+        i += 1
+        bezCurve, _ = fitSingleCubic(points[first:last+1], left, right, maxError, newtonIterations, newtonTolerance,
+                                     stats)
+        if bezCurve is not None:
+            beziers.append(array(bezCurve, dtype=float)[newaxis])
+            continue
+        refitted += 1
+        if refitted > maxRefitFraction * (len(splits)-1):
+            return None
+        beziers.append(fitCubic(points[first:last+1], left, right, maxError, newtonIterations, newtonTolerance,
+                                stats))
+
+    return concatenate(beziers)
+
+
+# Fit a closed contour (points[-1] connects back to points[0]) by splitting it
+# at its sharp corners and fitting every corner-to-corner run on its own with
+# one-sided tangents, so the only breaks in tangent continuity are real corners.
+# A contour without corners is fitted as one run from points[0] around to
+# points[0] again, with the same tangent on both sides of that seam. The runs
+# are independent, so mapper may be any map-like callable, e.g. Pool.map, to
+# fit them in parallel; it is called once with a list of fitSegment arguments.
+# Unlike fitCurve the returned curves close the loop.
+def fitCurveCorners(points, maxError, cornerAngle=60.0, cornerSpan=8.0, newtonIterations=1, newtonTolerance=1.0e-6,
+                    stats=None, mapper=map):
+    points = asarray(points, dtype=float)
+    corners = detectCorners(points, cornerAngle, cornerSpan)
+    if len(corners) == 0:
+        loop = concatenate((points, points[:1]))
+        seamTangent = normalize(points[1] - points[-1])
+        segments = [(loop, seamTangent, -seamTangent)]
+    else:
+        # rotate the contour so it starts and ends at the first corner
+        loop = concatenate((points[corners[0]:], points[:corners[0]+1]))
+        bounds = append(corners - corners[0], len(points))
+        segments = []
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            segment = loop[first:last+1]
+            segments.append((segment, normalize(segment[1] - segment[0]), normalize(segment[-2] - segment[-1])))
 
-def fitCubic(points, leftTangent, rightTangent, error):
+    beziers = []
+    for bezCurves, segmentStats in mapper(fitSegment, [segment + (maxError, newtonIterations, newtonTolerance)
+                                                       for segment in segments]):
+        beziers.append(bezCurves)
+        if stats is not None:
+            countStat(stats, 'splits', segmentStats.get('splits', 0))
+            countStat(stats, 'reparameterizations', segmentStats.get('reparameterizations', 0))
+            if 'maxError' in segmentStats:
+                recordError(stats, segmentStats['maxError'])
+    return concatenate(beziers)
+
+
+# One fitCurveCorners run, as a top-level function of a single tuple so it can
+# be handed to a process pool. Returns (beziers, stats dict).
+def fitSegment(args):
+    points, leftTangent, rightTangent, maxError, newtonIterations, newtonTolerance = args
+    stats = {}
+    return fitCubic(points, leftTangent, rightTangent, maxError, newtonIterations, newtonTolerance, stats), stats
+
+
+# Indices of the sharp corners of a closed contour, in contour order. The
+# direction of the outline is measured cornerSpan pixels (of arc length) before
+# and after every point, which smooths over the pixel staircase; points where
+# it turns by more than cornerAngle degrees are corner candidates, and only the
+# sharpest candidate within cornerSpan of another is kept.
+def detectCorners(points, cornerAngle=60.0, cornerSpan=8.0):
+    points = asarray(points, dtype=float)
+    edges = roll(points, -1, axis=0) - points
+    edgeLengths = linalg.norm(edges, axis=1)
+    perimeter = edgeLengths.sum()
+    if len(points) < 3 or perimeter < 4 * cornerSpan:
+        return array([], dtype=int)
+    arc = concatenate(([0.0], cumsum(edgeLengths)[:-1]))
+
+    def pointAt(s):
+        s = s % perimeter
+        i = searchsorted(arc, s, side='right') - 1
+        frac = (s - arc[i]) / where(edgeLengths[i] > 0, edgeLengths[i], 1.0)
+        return points[i] + frac[:, newaxis] * edges[i]
+
+    before = points - pointAt(arc - cornerSpan)
+    after = pointAt(arc + cornerSpan) - points
+    norms = linalg.norm(before, axis=1) * linalg.norm(after, axis=1)
+    cosTurn = (before * after).sum(axis=1) / where(norms > 0, norms, 1.0)
+    turn = degrees(arccos(clip(cosTurn, -1.0, 1.0)))
+    turn[norms == 0] = 0.0
+
+    candidates = nonzero(turn > cornerAngle)[0]
+    corners = []
+    for i in candidates[argsort(-turn[candidates], kind='stable')]:
+        gaps = abs(arc[corners] - arc[i]) if corners else array([])
+        if not (minimum(gaps, perimeter - gaps) <= cornerSpan).any():
+            corners.append(i)
+    return array(sorted(corners), dtype=int)
+
+
+# Try to fit a single cubic to points, returning (bezCurve, None) on success
+# or (None, splitPoint) with the index of the worst-fitting point on failure
+# (splitPoint is None when the error is not finite)
+def fitSingleCubic(points, leftTangent, rightTangent, error, newtonIterations=1, newtonTolerance=1.0e-6,
+                   stats=None):
     # Use heuristic if region only has two points in it
     if (len(points) == 2):
         dist = linalg.norm(points[0] - points[1]) / 3.0
         bezCurve = [points[0], points[0] + leftTangent * dist, points[1] + rightTangent * dist, points[1]]
-        return [bezCurve]
+        return bezCurve, None
 
     # Parameterize points, and attempt to fit curve
     u = chordLengthParameterize(points)
@@ -28,59 +385,64 @@ def fitCubic(points, leftTangent, rightTangent, error):
     # Find max deviation of points to fitted curve
     maxError, splitPoint = computeMaxError(points, bezCurve, u)
     if maxError < error:
-        return [bezCurve]
+        recordError(stats, maxError)
+        return bezCurve, None
 
     # If error not too large, try some reparameterization and iteration
     if maxError < error**2:
         for i in range(20):
-            uPrime = reparameterize(bezCurve, points, u)
+            uPrime = reparameterize(bezCurve, points, u, newtonIterations, newtonTolerance)
+            countStat(stats, 'reparameterizations')
             bezCurve = generateBezier(points, uPrime, leftTangent, rightTangent)
             maxError, splitPoint = computeMaxError(points, bezCurve, uPrime)
             if maxError < error:
-                return [bezCurve]
+                recordError(stats, maxError)
+                return bezCurve, None
             u = uPrime
 
-    # Fitting failed -- split at max error point and fit recursively
-    beziers = []
-    centerTangent = normalize(points[splitPoint-1] - points[splitPoint+1])
-    beziers += fitCubic(points[:splitPoint+1], leftTangent, centerTangent, error)
-    beziers += fitCubic(points[splitPoint:], -centerTangent, rightTangent, error)
+    if not isfinite(maxError):
+        return None, None
+    return None, splitPoint
 
-    return beziers
+
+def recordError(stats, maxError):
+    if stats is not None:
+        stats['maxError'] = float(maximum(stats.get('maxError', 0.0), maxError))
 
 
 def generateBezier(points, parameters, leftTangent, rightTangent):
     bezCurve = [points[0], None, None, points[-1]]
+    u = asarray(parameters, dtype=float)
 
-    # compute the A's
-    A = zeros((len(parameters), 2, 2))
-    for i, u in enumerate(parameters):
-        A[i][0] = leftTangent  * 3*(1-u)**2 * u
-        A[i][1] = rightTangent * 3*(1-u)    * u**2
+    # compute the A's, one row per point
+    A0 = outer(3*(1-u)**2 * u, leftTangent)
+    A1 = outer(3*(1-u)    * u**2, rightTangent)
 
     # Create the C and X matrices
     C = zeros((2, 2))
     X = zeros(2)
 
-    for i, (point, u) in enumerate(zip(points, parameters)):
-        C[0][0] += dot(A[i][0], A[i][0])
-        C[0][1] += dot(A[i][0], A[i][1])
-        C[1][0] += dot(A[i][0], A[i][1])
-        C[1][1] += dot(A[i][1], A[i][1])
+    C[0][0] = (A0 * A0).sum()
+    C[0][1] = (A0 * A1).sum()
+    C[1][0] = C[0][1]
+    C[1][1] = (A1 * A1).sum()
 
-        tmp = point - bezier.q([points[0], points[0], points[-1], points[-1]], u)
+    tmp = points - bezier.q([points[0], points[0], points[-1], points[-1]], u[:, newaxis])
 
-        X[0] += dot(A[i][0], tmp)
-        X[1] += dot(A[i][1], tmp)
+    X[0] = (A0 * tmp).sum()
+    X[1] = (A1 * tmp).sum()
 
     # Compute the determinants of C and X
     det_C0_C1 = C[0][0] * C[1][1] - C[1][0] * C[0][1]
     det_C0_X  = C[0][0] * X[1] - C[1][0] * X[0]
     det_X_C1  = X[0] * C[1][1] - X[1] * C[0][1]
 
-    # Finally, derive alpha values
-    alpha_l = 0.0 if det_C0_C1 == 0 else det_X_C1 / det_C0_C1
-    alpha_r = 0.0 if det_C0_C1 == 0 else det_C0_X / det_C0_C1
+    # Finally, derive alpha values. C is singular in exact arithmetic for e.g.
+    # three-point segments, where the summed products leave a rounding residue
+    # instead of an exact 0, so test the determinant relative to C's scale.
+    singular = abs(det_C0_C1) <= SINGULAR_TOLERANCE * C[0][0] * C[1][1]
+    alpha_l = 0.0 if singular else det_X_C1 / det_C0_C1
+    alpha_r = 0.0 if singular else det_C0_X / det_C0_C1
 
     # If alpha negative, use the Wu/Barsky heuristic (see text) */
     # (if alpha is 0, you get coincident control points that lead to
@@ -103,8 +465,17 @@ def generateBezier(points, parameters, leftTangent, rightTangent):
     return bezCurve
 
 
-def reparameterize(bezier, points, parameters):
-    return [newtonRaphsonRootFind(bezier, point, u) for point, u in zip(points, parameters)]
+# Newton-Raphson update of the whole parameter vector at once
+def reparameterize(bez, points, parameters, iterations=1, tolerance=1.0e-6):
+    u = asarray(parameters, dtype=float)
+    for i in range(iterations):
+        uPrime = newtonRaphsonRootFind(bez, points, u)
+        converged = abs(uPrime - u).max() <= tolerance
+        u = uPrime
+        if converged:
+            break
+
+    return u
 
 
 def newtonRaphsonRootFind(bez, point, u):
@@ -122,36 +493,36 @@ def newtonRaphsonRootFind(bez, point, u):
 
        gives
        u_n+1 = u_n - |q(u_n)-p * q'(u_n)| / |q'(u_n)**2 + q(u_n)-p * q''(u_n)|
+
+       point and u may also be an (N, 2) array of points and an (N,) array of
+       parameters, in which case all N roots are updated at once.
     """
-    d = bezier.q(bez, u)-point
-    numerator = (d * bezier.qprime(bez, u)).sum()
-    denominator = (bezier.qprime(bez, u)**2 + d * bezier.qprimeprime(bez, u)).sum()
+    t = asarray(u, dtype=float)[..., newaxis]
+    d = bezier.q(bez, t)-point
+    qp = bezier.qprime(bez, t)
+    numerator = (d * qp).sum(axis=-1)
+    denominator = (qp**2 + d * bezier.qprimeprime(bez, t)).sum(axis=-1)
 
-    if denominator == 0.0:
-        return u
-    else:
-        return u - numerator/denominator
+    # leave u untouched wherever the denominator vanishes
+    singular = denominator == 0.0
+    return where(singular, u, u - numerator/where(singular, 1.0, denominator))
 
 
 def chordLengthParameterize(points):
-    u = [0.0]
-    for i in range(1, len(points)):
-        u.append(u[i-1] + linalg.norm(points[i] - points[i-1]))
-
-    for i, _ in enumerate(u):
-        u[i] = u[i] / u[-1]
-
-    return u
+    u = concatenate(([0.0], cumsum(linalg.norm(diff(points, axis=0), axis=1))))
+    return u / u[-1]
 
 
 def computeMaxError(points, bez, parameters):
-    maxDist = 0.0
-    splitPoint = len(points)/2
-    for i, (point, u) in enumerate(zip(points, parameters)):
-        dist = linalg.norm(bezier.q(bez, u)-point)**2
-        if dist > maxDist:
-            maxDist = dist
-            splitPoint = i
+    u = asarray(parameters, dtype=float)
+    dists = ((bezier.q(bez, u[:, newaxis]) - points)**2).sum(axis=1)
+    # like the original per-point loop, NaN distances (from repeated points)
+    # never count as the maximum
+    dists[isnan(dists)] = 0.0
+    splitPoint = int(dists.argmax())
+    maxDist = dists[splitPoint]
+    if maxDist <= 0.0:
+        splitPoint = len(points)//2
 
     return maxDist, splitPoint
 
@@ -159,3 +530,14 @@ def computeMaxError(points, bez, parameters):
 def normalize(v):
     return v / linalg.norm(v)
 
+
+# Tangent at an interior point where the contour is split. Where the contour
+# folds back on itself (the tip of a one pixel wide spike) both neighbours
+# coincide, so turn perpendicular to the spike instead of dividing by zero.
+def splitTangent(points, i):
+    v = points[i-1] - points[i+1]
+    if not v.any():
+        d = points[i-1] - points[i]
+        v = array([-d[1], d[0]])
+    return normalize(v)
+
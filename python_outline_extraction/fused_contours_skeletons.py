@@ -0,0 +1,133 @@
+"""
+Contours and pose skeletons of a folder of PNG frames in a single pass.
+
+process_video_pngs' contours and skeletons stages each decode every frame,
+and the pose detector always sees the whole frame. Here every frame is
+decoded once: its alpha channel gives the matte for the Bezier fit of
+contourExtract, and the pose detector of pngs_to_skeleton only runs on the
+silhouette's padded bounding box, with landmarks mapped back to whole-frame
+coordinates. Frames without a silhouette skip pose detection altogether.
+"""
+import os
+import multiprocessing
+import cv2
+import contourExtract
+from pngs_to_skeleton import create_pose_detector, init_worker, pose_connections, process_crop, worker_detector
+
+
+def silhouette_box(matte, threshold=127, pad=0.25, min_size=96):
+    """
+    Returns the (x, y, width, height) bounding box of the matte pixels above
+    threshold, grown by pad times its larger side on every edge (the pose
+    detector needs some context around the body) and to at least min_size
+    pixels, clipped to the frame. None if the matte is empty.
+    """
+    _, mask = cv2.threshold(matte, threshold, 255, cv2.THRESH_BINARY)
+    x, y, width, height = cv2.boundingRect(mask)
+    if width == 0 or height == 0:
+        return None
+    margin = int(pad * max(width, height))
+    grow_x = max(margin, (min_size - width + 1) // 2)
+    grow_y = max(margin, (min_size - height + 1) // 2)
+    frame_height, frame_width = matte.shape[:2]
+    left, top = max(x - grow_x, 0), max(y - grow_y, 0)
+    right, bottom = min(x + width + grow_x, frame_width), min(y + height + grow_y, frame_height)
+    return left, top, right - left, bottom - top
+
+
+def process_frame(detector, image_path, pad=0.25, **contour_options):
+    """
+    Decodes one BGRA frame and returns (contour, landmarks_data): the result
+    of contourExtract.extract_contours_from_matte for its alpha channel with
+    contour_options, and pngs_to_skeleton's landmark data for the silhouette's
+    box (see silhouette_box).
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if image is None or image.ndim != 3 or image.shape[2] != 4:
+        raise ValueError(f"{image_path} is not a BGRA frame")
+    matte = image[:, :, 3]
+    contour = contourExtract.extract_contours_from_matte(matte, label=image_path, **contour_options)
+    box = silhouette_box(matte, pad=pad)
+    return contour, process_crop(detector, image, box) if box is not None else []
+
+
+def _process_shard(args):
+    image_paths, pad, contour_options = args
+    detector = worker_detector()
+    return [_process_or_report(detector, image_path, pad, contour_options) for image_path in image_paths]
+
+def _process_or_report(detector, image_path, pad, contour_options):
+    try:
+        return process_frame(detector, image_path, pad, **contour_options)
+    except Exception as e:
+        print(f"Error processing {image_path}: {str(e)}")
+        return [], []
+
+
+def extract_video_folder(video_folder_path, workers=1, shard_size=64, pad=0.25, holes=False, **contour_options):
+    """
+    Fits the contours and detects the poses of every PNG frame in a video
+    folder, in sorted frame order. Returns {"contours": ..., "skeletons": ...}:
+    the contours in the format of contourExtract.extract_contours_from_video_folder,
+    and {"frames": {file name: landmarks_data}, "connections": ...} like the
+    skeletons stage of process_video_pngs.
+
+    contour_options (max_error, simplify, corners, multi, min_area, lod,
+    curve_budget, exact_budget) and holes are the options of
+    extract_contours_from_video_folder; corners and multi fit serially within
+    each frame. Contour caching, temporal fitting and reduced previews are not
+    available, as the frame is decoded once at full size for both outputs.
+
+    With workers != 1 (None uses every core) frames are split into shards of
+    shard_size handed to a pool of worker processes, each owning its own
+    detector.
+    """
+    if holes:
+        contour_options["contour_mode"] = cv2.RETR_CCOMP
+    image_paths = sorted(os.path.join(video_folder_path, f) for f in os.listdir(video_folder_path)
+                         if f.lower().endswith(".png"))
+    if workers == 1:
+        detector = create_pose_detector()
+        results = (_process_or_report(detector, image_path, pad, contour_options) for image_path in image_paths)
+    else:
+        shards = [image_paths[i:i + shard_size] for i in range(0, len(image_paths), shard_size)]
+        # spawn rather than fork so no MediaPipe state is inherited by the workers
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=init_worker)
+        results = (result for shard in pool.imap(_process_shard, [(shard, pad, contour_options) for shard in shards])
+                   for result in shard)
+
+    try:
+        video_contours = {"frames": []}
+        skeleton_frames = {}
+        for image_path, (contour, landmarks_data) in zip(image_paths, results):
+            if not contourExtract.add_frame(video_contours, contour):
+                print("no contour found or error for", image_path)
+            skeleton_frames[os.path.basename(image_path)] = landmarks_data
+    finally:
+        if workers == 1:
+            detector.close()
+        else:
+            pool.close()
+            pool.join()
+    return {"contours": video_contours, "skeletons": {"frames": skeleton_frames, "connections": pose_connections()}}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Fit contours and detect poses of a folder of PNG frames in one pass.")
+    parser.add_argument("video_folder", help="Folder of one video's RGBA PNG frames.")
+    parser.add_argument("contours_file", help="Output contours JSON, keyed by the folder name like all_video_contours.json.")
+    parser.add_argument("skeletons_file", help="Output skeletons JSON, in the skeletons.json format.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each with its own detector (0 uses every core).")
+    parser.add_argument("--pad", type=float, default=0.25, help="Pose crop padding as a fraction of the silhouette's larger side.")
+    args = parser.parse_args()
+
+    video = os.path.basename(os.path.normpath(args.video_folder))
+    result = extract_video_folder(args.video_folder, args.workers or None, pad=args.pad)
+    with open(args.contours_file, "w") as f:
+        json.dump({video: result["contours"]}, f)
+    with open(args.skeletons_file, "w") as f:
+        json.dump({"data": {video: result["skeletons"]["frames"]}, "connections": result["skeletons"]["connections"]}, f,
+                  indent=2)
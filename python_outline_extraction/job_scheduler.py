@@ -0,0 +1,107 @@
+"""
+Bounded concurrent runner for external tools (ffmpeg, basisu).
+
+Each Job is one command line. run_jobs runs up to `parallelism` of them at a
+time. Every job's stdout and stderr go to its own log file, and a job that
+fails or times out is retried up to `retries` times. The tools do the heavy
+lifting in their own processes, so a thread per running job is enough.
+"""
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """
+    One external command.
+
+    Parameters:
+        name: Label used in progress messages and results, e.g. the video name.
+        cmd: Argument list passed to subprocess.
+        log_path: File that receives the command's stdout and stderr (appended
+                  to on retries), or None to inherit the parent's streams.
+        timeout: Seconds before an attempt is killed, None to wait forever.
+        retries: Extra attempts after a failure or timeout.
+    """
+
+    def __init__(self, name, cmd, log_path=None, timeout=None, retries=0):
+        self.name = name
+        self.cmd = cmd
+        self.log_path = log_path
+        self.timeout = timeout
+        # a negative count would skip the attempt loop altogether
+        self.retries = max(retries, 0)
+
+
+class JobResult:
+    def __init__(self, job, returncode, attempts, seconds, error=None):
+        self.job = job
+        self.returncode = returncode
+        self.attempts = attempts
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+_print_lock = threading.Lock()
+
+def _log(*args):
+    with _print_lock:
+        print(*args)
+
+
+def run_job(job):
+    """Run one job with its retries; never raises, failures are described by the JobResult."""
+    start = time.perf_counter()
+    returncode, error = None, None
+    log = None
+    if job.log_path is not None:
+        os.makedirs(os.path.dirname(job.log_path) or ".", exist_ok=True)
+        log = open(job.log_path, "w")
+    try:
+        for attempt in range(1, job.retries + 2):
+            if log is not None:
+                log.write(f"$ {' '.join(job.cmd)}  (attempt {attempt})\n")
+                log.flush()
+            try:
+                returncode = subprocess.run(job.cmd, stdout=log, stderr=subprocess.STDOUT if log else None,
+                                            timeout=job.timeout).returncode
+                error = None if returncode == 0 else f"exit status {returncode}"
+            except subprocess.TimeoutExpired:
+                returncode, error = None, f"timed out after {job.timeout}s"
+            except OSError as e:
+                # e.g. the executable is missing; retrying won't help
+                returncode, error = None, str(e)
+                break
+            if returncode == 0:
+                break
+            if attempt <= job.retries:
+                _log(f"[{job.name}] {error}, retrying ({attempt}/{job.retries})")
+    finally:
+        if log is not None:
+            log.close()
+    return JobResult(job, returncode, attempt, time.perf_counter() - start, error)
+
+
+def run_jobs(jobs, parallelism=1):
+    """
+    Run jobs with at most `parallelism` running at once, printing each one as it
+    finishes. Returns the JobResults in the order of jobs.
+    """
+    def run_and_report(job):
+        _log(f"[{job.name}] started")
+        result = run_job(job)
+        log_note = f", log in {job.log_path}" if job.log_path else ""
+        if result.ok:
+            _log(f"[{job.name}] done in {result.seconds:.1f}s")
+        else:
+            _log(f"[{job.name}] failed after {result.attempts} attempt(s): {result.error}{log_note}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(parallelism, 1)) as executor:
+        return list(executor.map(run_and_report, jobs))
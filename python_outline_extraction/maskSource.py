@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+
+
+class AlphaMaskSource:
+  """
+  Loads the alpha channel of RGBA PNG frames as a matte for
+  contourExtract.extract_contours(mask_source=...).
+
+  The PNG still has to be decoded as a whole (OpenCV has no alpha-only or
+  decode-into-buffer path for PNGs), but nothing else is allocated per frame:
+  the alpha channel is read through a strided view of the decoded image and
+  copied into one buffer that is reused for every frame of the same size.
+  The returned matte is only valid until the next call.
+
+  reduce > 1 keeps every reduce-th pixel in both directions, for quick
+  preview runs; extract_contours scales the contour back up by reduce, so the
+  curves stay in full resolution coordinates.
+
+  The buffer is not pickled, so an instance can be handed to pool workers and
+  each worker allocates its own on first use.
+  """
+
+  def __init__(self, reduce=1):
+    if reduce < 1:
+      raise ValueError("reduce must be at least 1")
+    self.reduce = reduce
+    self._buffer = None
+
+  def __call__(self, image_path):
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+      raise ValueError("could not read image")
+    if image.ndim != 3 or image.shape[2] != 4:
+      raise ValueError("the alpha matte needs a BGRA frame")
+    alpha = image[::self.reduce, ::self.reduce, 3]
+    if self._buffer is None or self._buffer.shape != alpha.shape:
+      self._buffer = np.empty(alpha.shape, dtype=np.uint8)
+    np.copyto(self._buffer, alpha)
+    return self._buffer
+
+  def cache_params(self):
+    """Parameters that change the fit, for ContourCache keys."""
+    return {"reduce": self.reduce} if self.reduce != 1 else {}
+
+  def __getstate__(self):
+    return {"reduce": self.reduce, "_buffer": None}
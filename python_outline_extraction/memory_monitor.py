@@ -0,0 +1,56 @@
+import os
+import resource
+import sys
+import tracemalloc
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (peak RSS where the current value is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and KB elsewhere
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+class MemoryMonitor:
+    """
+    Reports process memory every `every` frames. With use_tracemalloc the
+    report also lists the `top` source lines whose Python allocations grew the
+    most since the previous report.
+    """
+
+    def __init__(self, every=100, use_tracemalloc=False, top=10):
+        self.every = every
+        self.use_tracemalloc = use_tracemalloc
+        self.top = top
+        self.start_rss = current_rss_mb()
+        self.peak_rss = self.start_rss
+        self._snapshot = None
+        if use_tracemalloc:
+            tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def frame(self, frame_idx):
+        if frame_idx % self.every == 0:
+            self.report(f"frame {frame_idx}")
+
+    def report(self, label):
+        rss = current_rss_mb()
+        self.peak_rss = max(self.peak_rss, rss)
+        print(f"[memory] {label}: rss {rss:.1f} MB ({rss - self.start_rss:+.1f} MB since start)")
+        if self.use_tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            print(f"[memory]   python heap {current / 2**20:.1f} MB (peak {peak / 2**20:.1f} MB)")
+            snapshot = tracemalloc.take_snapshot()
+            for stat in snapshot.compare_to(self._snapshot, 'lineno')[:self.top]:
+                print(f"[memory]   {stat}")
+            self._snapshot = snapshot
+
+    def close(self):
+        self.report("end")
+        print(f"[memory] peak rss {self.peak_rss:.1f} MB")
+        if self.use_tracemalloc:
+            tracemalloc.stop()
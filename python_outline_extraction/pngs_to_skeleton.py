@@ -6,6 +6,9 @@ import glob
 import os
 import json
 import numpy as np
+import cv2
+import multiprocessing
+from skeleton_columnar import grouped_to_columnar, save_columnar
 
 def create_pose_detector():
     """Create and return a pose detector instance."""
@@ -19,8 +22,29 @@ def process_image(detector, image_path):
     """Process a single image and return the landmark data with metadata."""
     # Load and process image
     image = mp.Image.create_from_file(image_path)
-    detection_result = detector.detect(image)
-
+    return landmarks_to_data(detector.detect(image))
+
+def process_crop(detector, image, box):
+    """
+    Detect poses in the (x, y, width, height) box of a decoded BGRA frame and
+    return the landmark data in the normalized coordinates of the whole frame,
+    as process_image would.
+    """
+    x, y, width, height = box
+    crop = cv2.cvtColor(image[y:y + height, x:x + width], cv2.COLOR_BGRA2RGBA)
+    detection_result = detector.detect(mp.Image(image_format=mp.ImageFormat.SRGBA, data=crop))
+    frame_height, frame_width = image.shape[:2]
+    return landmarks_to_data(detection_result, (x / frame_width, y / frame_height,
+                                                width / frame_width, height / frame_height))
+
+def landmarks_to_data(detection_result, box=(0.0, 0.0, 1.0, 1.0)):
+    """
+    Convert a detection result to serializable landmark data. box is the
+    normalized (x, y, width, height) of the detector input within the frame;
+    landmarks are mapped from it back to frame coordinates (z scales with x,
+    as MediaPipe measures depth in units of image width).
+    """
+    box_x, box_y, box_width, box_height = box
     # Metadata for landmarks and connections
     pose_landmark_names = [landmark.name for landmark in mp.solutions.pose.PoseLandmark]
     
@@ -34,9 +58,9 @@ def process_image(detector, image_path):
         for idx, landmark in enumerate(pose_landmarks):
             landmarks.append({
                 'name': pose_landmark_names[idx],
-                'x': float(landmark.x),
-                'y': float(landmark.y),
-                'z': float(landmark.z),
+                'x': float(box_x + landmark.x * box_width),
+                'y': float(box_y + landmark.y * box_height),
+                'z': float(landmark.z * box_width),
                 'visibility': float(landmark.visibility) if hasattr(landmark, 'visibility') else None,
                 'presence': float(landmark.presence) if hasattr(landmark, 'presence') else None
             }) 
@@ -55,9 +79,72 @@ def collect_png_files(input_dir, nested):
         return sorted(glob.glob(os.path.join(input_dir, '*.png')))
 
 
-def compute_skeletons_for_folder_of_videos(input_dir, neststed, output_file):
-    detector = create_pose_detector()
+# detector owned by each worker process, created once by init_worker
+_worker_detector = None
+_worker_error = None
+
+def init_worker():
+    """Pool initializer creating the worker's pose detector, see worker_detector."""
+    # an exception escaping a Pool initializer makes the pool respawn workers
+    # forever, so keep it and re-raise from worker_detector instead
+    global _worker_detector, _worker_error
+    try:
+        _worker_detector = create_pose_detector()
+    except Exception as e:
+        _worker_error = e
+
+def worker_detector():
+    """The detector of a worker process started with init_worker; raises RuntimeError if it could not be created."""
+    if _worker_error is not None:
+        raise RuntimeError(f"Could not create pose detector: {_worker_error}")
+    return _worker_detector
+
+def _process_shard(image_paths):
+    """Run the worker's detector over a contiguous shard of the file list."""
+    detector = worker_detector()
+    shard_results = []
+    for image_path in image_paths:
+        try:
+            shard_results.append((image_path, process_image(detector, image_path)))
+        except Exception as e:
+            print(f"Error processing {image_path}: {str(e)}")
+    return shard_results
+
+def _iter_results(png_files, workers, shard_size):
+    """Yield (image_path, landmarks_data) in png_files order, serially or from a worker pool."""
+    if workers == 1:
+        detector = create_pose_detector()
+        for image_path in png_files:
+            try:
+                yield image_path, process_image(detector, image_path)
+            except Exception as e:
+                print(f"Error processing {image_path}: {str(e)}")
+        return
+
+    shards = [png_files[i:i + shard_size] for i in range(0, len(png_files), shard_size)]
+    # spawn rather than fork so no MediaPipe state is inherited by the workers
+    with multiprocessing.get_context('spawn').Pool(workers, initializer=init_worker) as pool:
+        # imap returns shards in submission order, so the merge is deterministic
+        for shard_results in pool.imap(_process_shard, shards):
+            yield from shard_results
 
+
+def pose_connections():
+    """The pose skeleton as {start landmark name: end landmark name}."""
+    pose_landmark_names = [landmark.name for landmark in mp.solutions.pose.PoseLandmark]
+    connections = {}
+    for start_idx, end_idx in mp.solutions.pose.POSE_CONNECTIONS:
+        connections[pose_landmark_names[start_idx]] = pose_landmark_names[end_idx]
+    return connections
+
+
+def compute_skeletons_for_folder_of_videos(input_dir, neststed, output_file, workers=1, shard_size=64):
+    """
+    Detect poses in every PNG under input_dir, grouped by parent directory.
+    With workers != 1 (None uses every core) the file list is split into
+    shards of shard_size images that are processed by a pool of worker
+    processes, each owning its own detector.
+    """
     # Collect PNG files
     png_files = collect_png_files(input_dir, neststed)
 
@@ -69,34 +156,21 @@ def compute_skeletons_for_folder_of_videos(input_dir, neststed, output_file):
     grouped_results = {}
     grouped_results['data'] = {}
 
-    connections = mp.solutions.pose.POSE_CONNECTIONS
-    pose_landmark_names = [landmark.name for landmark in mp.solutions.pose.PoseLandmark]
-    grouped_results['connections'] = {}
-    for connection in connections:
-        start_idx, end_idx = connection
-        # connections_data.append({
-        #     'start_landmark': pose_landmark_names[start_idx],
-        #     'end_landmark': pose_landmark_names[end_idx]
-        # })
-        grouped_results['connections'][pose_landmark_names[start_idx]] = pose_landmark_names[end_idx]
-
-    for image_path in png_files:
-        try:
-            print(f"Processing {image_path}...")
-            landmarks_data = process_image(detector, image_path)
+    grouped_results['connections'] = pose_connections()
 
-            # Group results by parent directory (relative to input_dir)
-            parent_dir = os.path.relpath(os.path.dirname(image_path), input_dir)
-            file_name = os.path.basename(image_path)
+    for count, (image_path, landmarks_data) in enumerate(_iter_results(png_files, workers, shard_size)):
+        if count % 100 == 0:
+            print(f"Processing {image_path} ({count + 1}/{len(png_files)})...")
 
-            if parent_dir not in grouped_results['data']:
-                grouped_results['data'][parent_dir] = {}
+        # Group results by parent directory (relative to input_dir)
+        parent_dir = os.path.relpath(os.path.dirname(image_path), input_dir)
+        file_name = os.path.basename(image_path)
 
-            grouped_results['data'][parent_dir][file_name] = landmarks_data
-        except Exception as e:
-            print(f"Error processing {image_path}: {str(e)}")
+        if parent_dir not in grouped_results['data']:
+            grouped_results['data'][parent_dir] = {}
+
+        grouped_results['data'][parent_dir][file_name] = landmarks_data
 
-    
 
     return grouped_results
 
@@ -110,6 +184,10 @@ def main():
                        help='Path to the pose landmarker task file')
     parser.add_argument('--nested', action='store_true',
                         help='Indicate if the input directory contains directories of PNG files')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes, each with its own detector (0 uses every core)')
+    parser.add_argument('--format', choices=['json', 'columnar'], default='json',
+                        help="'columnar' saves float32 landmark arrays (.npz output_file or a directory of .npy files)")
 
     args = parser.parse_args()
 
@@ -120,12 +198,15 @@ def main():
         return
 
     # Create detector
-    results = compute_skeletons_for_folder_of_videos(args.input_dir, args.nested, args.output_file)
+    results = compute_skeletons_for_folder_of_videos(args.input_dir, args.nested, args.output_file, args.workers or None)
 
     # Save results to JSON file
     try:
-        with open(args.output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        if args.format == 'columnar':
+            save_columnar(grouped_to_columnar(results), args.output_file)
+        else:
+            with open(args.output_file, 'w') as f:
+                json.dump(results, f, indent=2)
         print(f"\nResults saved to {args.output_file}")
     except Exception as e:
         print(f"Error saving results: {str(e)}")
@@ -1,10 +1,73 @@
 import os
-import subprocess
 from pngs_to_skeleton import compute_skeletons_for_folder_of_videos
-from contourExtract import extract_contours_from_folder_of_videos
+from fused_contours_skeletons import extract_video_folder as extract_contours_and_skeletons
+from contourExtract import extract_contours_from_folder_of_videos, extract_contours_from_video_folder, split_levels
+from contourCache import ContourCache
+from contourBinary import write_contours_binary
+from contourMetrics import ContourMetrics
+from splineResample import resample_all_videos, write_splines_binary
+from stage_runner import Stage, StageRunner, list_files, list_video_folders
+from job_scheduler import Job, run_job, run_jobs
 import json
 
-def scale_pngs(input_root, output_root):
+STAGES = ["scale", "compress", "contours", "splines", "skeletons", "fused"]
+
+def scale_job(subdir_path, output_subdir_path, log_dir=None, timeout=None, retries=0, ffmpeg="ffmpeg"):
+    """The ffmpeg job scaling the PNGs of one video folder to 960x540."""
+    # Construct the ffmpeg command
+    input_pattern = os.path.join(subdir_path, "*.png")
+    output_pattern = os.path.join(output_subdir_path, "%05d.png")
+    command = [
+        ffmpeg,
+        "-pattern_type", "glob",
+        "-i", input_pattern,
+        "-vf", "scale=960:540",
+        output_pattern
+    ]
+    name = os.path.basename(subdir_path)
+    log_path = os.path.join(log_dir, "scale", name + ".log") if log_dir else None
+    return Job(f"scale {name}", command, log_path, timeout, retries)
+
+def compress_job(subdir_path, num_files, log_dir=None, timeout=None, retries=0, basisu="basisu"):
+    """The basisu job encoding one folder of PNGs into <subdir_path>_texture_array.ktx2."""
+    # Assemble the command
+    cmd = [
+        basisu,
+        "-uastc", "-ktx2", "-tex_array",
+        "-multifile_printf", os.path.join(subdir_path, "%06u.png"),
+        "-multifile_first", "0",
+        "-multifile_num", str(num_files),
+        "-output_file", f"{subdir_path}_texture_array.ktx2"
+    ]
+    name = os.path.basename(subdir_path)
+    log_path = os.path.join(log_dir, "compress", name + ".log") if log_dir else None
+    return Job(f"compress {name}", cmd, log_path, timeout, retries)
+
+def texture_is_current(subdir_path):
+    """True if <subdir_path>_texture_array.ktx2 exists and is newer than every file in subdir_path."""
+    try:
+        texture_mtime = os.path.getmtime(f"{subdir_path}_texture_array.ktx2")
+    except OSError:
+        return False
+    return all(os.path.getmtime(os.path.join(subdir_path, f)) <= texture_mtime for f in os.listdir(subdir_path))
+
+def count_files(subdir_path):
+    return len([f for f in os.listdir(subdir_path) if os.path.isfile(os.path.join(subdir_path, f))])
+
+def _run_or_raise(job):
+    result = run_job(job)
+    if not result.ok:
+        raise RuntimeError(f"{job.name} failed after {result.attempts} attempt(s): {result.error}")
+
+def scale_video(subdir_path, output_subdir_path, **job_options):
+    """Scale one video folder with ffmpeg, raising RuntimeError on failure. job_options go to scale_job."""
+    os.makedirs(output_subdir_path, exist_ok=True)
+    print(f"Processing {subdir_path} -> {output_subdir_path}")
+    _run_or_raise(scale_job(subdir_path, output_subdir_path, **job_options))
+
+def scale_pngs(input_root, output_root, parallelism=1, **job_options):
+    """Scale every subdirectory of input_root, running up to parallelism ffmpeg processes at once."""
+    jobs = []
     # Iterate over all subdirectories in the input root directory
     for subdir in os.listdir(input_root):
         subdir_path = os.path.join(input_root, subdir)
@@ -12,61 +75,55 @@ def scale_pngs(input_root, output_root):
             # Create the corresponding output subdirectory
             output_subdir_path = os.path.join(output_root, subdir)
             os.makedirs(output_subdir_path, exist_ok=True)
+            jobs.append(scale_job(subdir_path, output_subdir_path, **job_options))
+    return run_jobs(jobs, parallelism)
+
+def compress_video(subdir_path, **job_options):
+    """
+    Encode one folder of PNGs with basisu unless its texture array is already
+    newer than every frame. Returns False if there was nothing to do; raises
+    RuntimeError on failure. job_options go to compress_job.
+    """
+    num_files = count_files(subdir_path)
+    if num_files == 0:
+        print(f"No files found in {subdir_path}")
+        return False
+    if texture_is_current(subdir_path):
+        print(f"{subdir_path}_texture_array.ktx2 is up to date")
+        return False
 
-            # Construct the ffmpeg command
-            input_pattern = os.path.join(subdir_path, "*.png")
-            output_pattern = os.path.join(output_subdir_path, "%05d.png")
-            command = [
-                "ffmpeg",
-                "-pattern_type", "glob",
-                "-i", input_pattern,
-                "-vf", "scale=960:540",
-                output_pattern
-            ]
-
-            # Run the ffmpeg command
-            print(f"Processing {subdir_path} -> {output_subdir_path}")
-            try:
-                subprocess.run(command, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error processing {subdir}: {e}")
-
-def compress_textures(target_dir):
+    print(f"Processing {subdir_path} with {num_files} files...")
+    _run_or_raise(compress_job(subdir_path, num_files, **job_options))
+    return True
+
+def compress_textures(target_dir, parallelism=1, **job_options):
+    """
+    Encode every subdirectory of target_dir whose texture array is missing or
+    older than its frames, running up to parallelism basisu processes at once.
+    """
+    jobs = []
     # Iterate over all subdirectories in the target directory
     for subdir in os.listdir(target_dir):
         subdir_path = os.path.join(target_dir, subdir)
-        if os.path.isdir(subdir_path):
+        # hidden folders hold the stage runner's markers and logs
+        if os.path.isdir(subdir_path) and not subdir.startswith("."):
             # Count total number of files in the directory
-            num_files = len([f for f in os.listdir(subdir_path) if os.path.isfile(os.path.join(subdir_path, f))])
-
-            if num_files > 0:
-                print(f"Processing {subdir_path} with {num_files} files...")
-
-                # Assemble the command
-                cmd = [
-                    "basisu",
-                    "-uastc", "-ktx2", "-tex_array",
-                    "-multifile_printf", os.path.join(subdir_path, "%06u.png"),
-                    "-multifile_first", "0",
-                    "-multifile_num", str(num_files),
-                    "-output_file", f"{subdir_path}_texture_array.ktx2"
-                ]
-
-                # Print the command for debugging
-                print(f"Executing command: {' '.join(cmd)}")
-
-                # Run the command
-                try:
-                    subprocess.run(cmd, check=True)
-                except subprocess.CalledProcessError as e:
-                    print(f"Error processing {subdir}: {e}")
-            else:
+            num_files = count_files(subdir_path)
+            if num_files == 0:
                 print(f"No files found in {subdir_path}")
+            elif texture_is_current(subdir_path):
+                print(f"{subdir_path}_texture_array.ktx2 is up to date")
+            else:
+                jobs.append(compress_job(subdir_path, num_files, **job_options))
+    return run_jobs(jobs, parallelism)
 
-def extract_skeletons(output_root):
+def extract_skeletons(output_root, workers=1):
     print("Extracting skeletons...")
     output_file = os.path.join(output_root, "skeletons.json")
-    results = compute_skeletons_for_folder_of_videos(output_root, True, output_file)
+    results = compute_skeletons_for_folder_of_videos(output_root, True, output_file, workers)
+    save_skeletons(results, output_file)
+
+def save_skeletons(results, output_file):
     try:
         with open(output_file, 'w') as f:
             json.dump(results, f, indent=2)
@@ -74,28 +131,205 @@ def extract_skeletons(output_root):
     except Exception as e:
         print(f"Error saving skeletons: {e}")
 
-def extract_contours(output_root):
+def extract_contours(output_root, workers=1, cache_dir=None, binary=False, cache_max_mb=1024, simplify=0):
     print("Extracting contours...")
-    all_video_contours = extract_contours_from_folder_of_videos(output_root)
+    cache = ContourCache(cache_dir, cache_max_mb << 20) if cache_dir else None
+    all_video_contours = extract_contours_from_folder_of_videos(output_root, workers, cache=cache, simplify=simplify)
+    save_contours(all_video_contours, output_root, binary)
+
+def save_contours(all_video_contours, output_root, binary=False):
+    """
+    Writes all_video_contours.json (and .bin) to output_root, plus an
+    all_video_contours_lod<max error>.json (and .bin) per level of detail.
+    """
+    all_video_contours, levels = split_levels(all_video_contours)
+    for key, level_contours in levels.items():
+        level_file = os.path.join(output_root, f"all_video_contours_lod{key}.json")
+        with open(level_file, "w") as f:
+            json.dump(level_contours, f)
+        if binary:
+            write_contours_binary(level_contours, os.path.join(output_root, f"all_video_contours_lod{key}.bin"))
+        print(f"Level {key} contours saved to {level_file}")
     output_file = os.path.join(output_root, "all_video_contours.json")
-    with open(output_file, "w") as f:
-        json.dump(all_video_contours, f, indent=2)
+    text = json.dumps(all_video_contours, indent=2)
+    # leave an identical file alone so its fingerprint, and the splines stage, stay up to date
+    try:
+        with open(output_file) as f:
+            unchanged = f.read() == text
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        with open(output_file, "w") as f:
+            f.write(text)
     print(f"Contours saved to {output_file}")
+    if binary:
+        binary_file = os.path.join(output_root, "all_video_contours.bin")
+        write_contours_binary(all_video_contours, binary_file)
+        print(f"Binary contours saved to {binary_file}")
+
+def save_splines(output_root, num_points=None):
+    """Resamples all_video_contours.json into all_video_splines.bin (see splineResample)."""
+    with open(os.path.join(output_root, "all_video_contours.json")) as f:
+        splines = resample_all_videos(json.load(f), num_points)
+    output_file = os.path.join(output_root, "all_video_splines.bin")
+    write_splines_binary(splines, output_file)
+    print(f"Splines saved to {output_file}")
+
+def build_stages(input_root, output_root, workers=1, cache_dir=None, binary=False, cache_max_mb=1024,
+                 tool_jobs=1, tool_timeout=None, tool_retries=0, ffmpeg="ffmpeg", basisu="basisu", metrics=None,
+                 contour_simplify=0, contour_corners=False, contour_parallel_segments=False, contour_multi=False,
+                 contour_holes=False, spline_points=None, contour_lod=(), contour_budget=0,
+                 contour_exact_budget=False, pose_pad=0.25):
+    """
+    The pipeline as stage_runner stages. scale reads input_root; every other
+    stage reads the scaled frames in output_root. contours and skeletons only
+    depend on scale, so they can run next to compress and each other.
+    splines resamples the merged contours file as a whole, so it is a single
+    unit that reruns whenever all_video_contours.json changes; spline_points
+    is its fixed point count per frame (default: the longest frame's).
+    fused replaces contours and skeletons with one pass that decodes every
+    frame once and runs the pose detector on the silhouette's bounding box
+    only, padded by pose_pad times its larger side (see
+    fused_contours_skeletons); it writes the same files.
+
+    scale and compress run up to tool_jobs ffmpeg/basisu processes at once,
+    with per-video logs in <output_root>/.logs. metrics is an optional
+    ContourMetrics for the videos the contours stage actually runs.
+    The contour_* options are the simplify, corners, parallel_segments, multi,
+    holes, lod, curve_budget and exact_budget options of
+    contourExtract.extract_contours_from_video_folder.
+    """
+    log_dir = os.path.join(output_root, ".logs")
+    tool_options = dict(log_dir=log_dir, timeout=tool_timeout, retries=tool_retries)
+    cache = ContourCache(cache_dir, cache_max_mb << 20) if cache_dir else None
+    output_pngs = lambda video: list_files(os.path.join(output_root, video))
+    # fit options are only part of the fingerprint when on, so existing markers stay valid
+    contour_params = {}
+    if contour_simplify:
+        contour_params["simplify"] = contour_simplify
+    if contour_corners:
+        contour_params["corners"] = True
+    if contour_multi:
+        contour_params["multi"] = True
+        contour_params["holes"] = contour_holes
+    if contour_lod:
+        contour_params["lod"] = sorted(contour_lod)
+    if contour_budget:
+        contour_params["curve_budget"] = contour_budget
+        contour_params["exact_budget"] = contour_exact_budget
+
+    def finish_contours(results):
+        if cache is not None:
+            cache.evict()
+        save_contours(results, output_root, binary)
+
+    def skeletons_for_video(video):
+        # results are keyed by folder relative to the one searched, '.' here
+        results = compute_skeletons_for_folder_of_videos(os.path.join(output_root, video), False, None, workers)
+        return results and {'frames': results['data'].get('.', {}), 'connections': results['connections']}
+
+    def finish_skeletons(results):
+        results = {video: result for video, result in results.items() if result}
+        connections = next(iter(results.values()))['connections'] if results else {}
+        save_skeletons({'data': {video: result['frames'] for video, result in results.items()},
+                        'connections': connections}, os.path.join(output_root, "skeletons.json"))
+
+    def fused_for_video(video):
+        return extract_contours_and_skeletons(os.path.join(output_root, video), workers, pad=pose_pad,
+                                              simplify=contour_simplify, corners=contour_corners,
+                                              multi=contour_multi, holes=contour_holes, lod=contour_lod,
+                                              curve_budget=contour_budget, exact_budget=contour_exact_budget)
+
+    def finish_fused(results):
+        finish_contours({video: result["contours"] for video, result in results.items()})
+        finish_skeletons({video: result["skeletons"] for video, result in results.items()})
+
+    return [
+        Stage("scale", lambda: list_video_folders(input_root),
+              lambda video: scale_video(os.path.join(input_root, video), os.path.join(output_root, video),
+                                        ffmpeg=ffmpeg, **tool_options),
+              lambda video: list_files(os.path.join(input_root, video)),
+              outputs=lambda video: [os.path.join(output_root, video)], parallelism=tool_jobs),
+        Stage("compress", lambda: list_video_folders(output_root),
+              lambda video: compress_video(os.path.join(output_root, video), basisu=basisu, **tool_options),
+              output_pngs, after=["scale"],
+              outputs=lambda video: [os.path.join(output_root, f"{video}_texture_array.ktx2")],
+              parallelism=tool_jobs),
+        Stage("contours", lambda: list_video_folders(output_root),
+              lambda video: extract_contours_from_video_folder(os.path.join(output_root, video), workers,
+                                                                cache=cache, metrics=metrics,
+                                                                simplify=contour_simplify, corners=contour_corners,
+                                                                parallel_segments=contour_parallel_segments,
+                                                                multi=contour_multi, holes=contour_holes,
+                                                                lod=contour_lod, curve_budget=contour_budget,
+                                                                exact_budget=contour_exact_budget),
+              output_pngs, after=["scale"], finish=finish_contours, params=contour_params),
+        Stage("splines", lambda: ["all"], lambda _: save_splines(output_root, spline_points),
+              lambda _: [os.path.join(output_root, "all_video_contours.json")], after=["contours", "fused"],
+              outputs=lambda _: [os.path.join(output_root, "all_video_splines.bin")],
+              params={"points": spline_points} if spline_points else None),
+        Stage("skeletons", lambda: list_video_folders(output_root), skeletons_for_video,
+              output_pngs, after=["scale"], finish=finish_skeletons),
+        Stage("fused", lambda: list_video_folders(output_root), fused_for_video,
+              output_pngs, after=["scale"], finish=finish_fused, params=dict(contour_params, pose_pad=pose_pad)),
+    ]
 
 if __name__ == "__main__":
     import argparse
+    import sys
 
-    parser = argparse.ArgumentParser(description="Scale PNGs, compress textures, extract skeletons, and contours.")
+    parser = argparse.ArgumentParser(description="Scale PNGs, compress textures, extract skeletons, contours and spline outlines.")
     parser.add_argument("input_root", help="Path to the root input directory containing subdirectories of PNGs.")
     parser.add_argument("output_root", help="Path to the root output directory where scaled images will be saved.")
 
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=["contours"],
+                        help="Stages to run (default: contours). Videos a stage already finished with unchanged inputs are skipped.")
+    parser.add_argument("--force", action="store_true", help="Rerun the selected stages for every video, ignoring completion markers.")
+    parser.add_argument("--serial-stages", action="store_true", help="Run one stage at a time instead of independent stages side by side.")
+    parser.add_argument("--marker-dir", default=None, help="Where to keep completion markers (default: <output_root>/.stages).")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for contour and skeleton extraction (0 uses every core).")
+    parser.add_argument("--tool-jobs", type=int, default=1, help="ffmpeg/basisu processes to run at once in the scale and compress stages.")
+    parser.add_argument("--tool-timeout", type=float, default=None, help="Seconds before an ffmpeg/basisu run is killed.")
+    parser.add_argument("--tool-retries", type=int, default=0, help="Extra attempts for a failed or timed out ffmpeg/basisu run.")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg executable to use.")
+    parser.add_argument("--basisu", default="basisu", help="basisu executable to use.")
+    parser.add_argument("--contour-cache-dir", default=None, help="Reuse contour fits of unchanged frames from this folder.")
+    parser.add_argument("--contour-cache-max-mb", type=int, default=1024, help="Size limit of the contour cache folder in MB.")
+    parser.add_argument("--contour-metrics", default=None, metavar="JSONL", help="Write per-frame contour timings and fit statistics to this JSONL file.")
+    parser.add_argument("--contour-simplify", type=float, default=0, metavar="FRACTION", help="Douglas-Peucker contours before fitting with a tolerance of FRACTION * sqrt(max error) pixels (0 = off).")
+    parser.add_argument("--contour-corners", action="store_true", help="Fit contours as closed loops split at their sharp corners.")
+    parser.add_argument("--contour-parallel-segments", action="store_true", help="With --contour-corners or --contour-multi, spread each frame's corner-to-corner runs or contours over the workers instead of whole frames.")
+    parser.add_argument("--contour-multi", action="store_true", help="Fit every sizeable contour of a frame instead of only the longest, adding a per-frame contour index to the output.")
+    parser.add_argument("--contour-holes", action="store_true", help="With --contour-multi, also fit the holes inside contours.")
+    parser.add_argument("--contour-lod", type=float, nargs="+", default=(), metavar="MAX_ERROR", help="Also fit every frame at these max errors, e.g. 16 8 2, saving each level to all_video_contours_lod<MAX_ERROR>.json (and .bin).")
+    parser.add_argument("--contour-budget", type=int, default=0, metavar="N", help="Fit at most N curves per frame.")
+    parser.add_argument("--contour-exact-budget", action="store_true", help="With --contour-budget, fit exactly N curves per frame, for fixed-size GPU buffers.")
+    parser.add_argument("--pose-pad", type=float, default=0.25, help="Padding of the fused stage's pose crop, as a fraction of the silhouette's larger side.")
+    parser.add_argument("--contours-binary", action="store_true", help="Also write contours in the compact binary format.")
+    parser.add_argument("--spline-points", type=int, default=None, help="Points per frame in all_video_splines.bin (default: the longest frame's sample count).")
+
     args = parser.parse_args()
+    if "fused" in args.stages and ({"contours", "skeletons"} & set(args.stages)):
+        parser.error("the fused stage replaces the contours and skeletons stages, don't select them together")
+    if args.tool_retries < 0:
+        parser.error("--tool-retries can't be negative")
 
     input_root_directory = args.input_root
     output_root_directory = args.output_root
 
-    # scale_pngs(input_root_directory, output_root_directory)
-    # compress_textures(output_root_directory)
-    extract_contours(output_root_directory)
-    # extract_skeletons(output_root_directory)
-    
+    metrics = ContourMetrics(args.contour_metrics) if args.contour_metrics else None
+    stages = build_stages(input_root_directory, output_root_directory, args.workers or None,
+                          args.contour_cache_dir, args.contours_binary, args.contour_cache_max_mb,
+                          args.tool_jobs, args.tool_timeout, args.tool_retries, args.ffmpeg, args.basisu, metrics,
+                          args.contour_simplify, args.contour_corners, args.contour_parallel_segments,
+                          args.contour_multi, args.contour_holes, args.spline_points, args.contour_lod,
+                          args.contour_budget, args.contour_exact_budget, args.pose_pad)
+    runner = StageRunner(stages, args.marker_dir or os.path.join(output_root_directory, ".stages"),
+                         force=args.force, concurrent=not args.serial_stages)
+    try:
+        ok = runner.run(args.stages)
+    finally:
+        if metrics is not None:
+            metrics.close()
+    runner.print_summary()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,163 @@
+"""
+Columnar storage for pose landmarks.
+
+Instead of one dict per landmark per frame, every video is stored as a
+(frames, persons, 33, 5) float32 array of x, y, z, visibility and presence,
+plus the list of frame names. Landmark names and connections are stored once.
+Persons missing from a frame (and missing visibility/presence values) are NaN.
+
+Two on-disk layouts are supported:
+    <name>.npz   one compressed archive, loaded fully into memory
+    <directory>  meta.json plus one video_<n>.npy per video, loaded memory-mapped
+"""
+import argparse
+import json
+import os
+import numpy as np
+
+FIELDS = ('x', 'y', 'z', 'visibility', 'presence')
+
+
+def poses_to_array(poses, num_persons, num_landmarks):
+    """Pack the pose dicts of one frame into a (num_persons, num_landmarks, 5) array."""
+    frame = np.full((num_persons, num_landmarks, len(FIELDS)), np.nan, dtype=np.float32)
+    for person_idx, pose in enumerate(poses[:num_persons]):
+        for landmark_idx, landmark in enumerate(pose['landmarks']):
+            frame[person_idx, landmark_idx] = [np.nan if landmark[field] is None else landmark[field]
+                                               for field in FIELDS]
+    return frame
+
+
+def array_to_poses(frame, landmark_names, include_person_id=True):
+    """Inverse of poses_to_array, skipping all-NaN person slots."""
+    poses = []
+    for person_idx, person in enumerate(frame):
+        if np.isnan(person[:, 0]).all():
+            continue
+        landmarks = []
+        for name, values in zip(landmark_names, person.tolist()):
+            landmark = {'name': name}
+            for field, value in zip(FIELDS, values):
+                landmark[field] = None if value != value else value
+            landmarks.append(landmark)
+        pose = {'person_id': person_idx, 'landmarks': landmarks} if include_person_id else {'landmarks': landmarks}
+        poses.append(pose)
+    return poses
+
+
+class ColumnarPoseWriter:
+    """
+    Drop-in replacement for video_to_skeletons.StreamingPoseWriter that packs
+    frames into arrays and saves them with save_columnar on close. Unlike the
+    streaming writer it holds every frame in memory until then.
+    """
+
+    def __init__(self, output_path, connections=None):
+        self.output_path = output_path
+        self.connections = connections
+        self.landmark_names = None
+        self._videos = {}
+        self._current = None
+
+    def begin_video(self, video_key):
+        self._current = self._videos.setdefault(video_key, ([], []))
+
+    def write_frame(self, frame_name, poses):
+        if self.landmark_names is None and poses:
+            self.landmark_names = [landmark['name'] for landmark in poses[0]['landmarks']]
+        frame_names, frames = self._current
+        frame_names.append(frame_name)
+        frames.append(poses_to_array(poses, len(poses), len(self.landmark_names or [])))
+
+    def columns(self):
+        """Return everything written so far in the form save_columnar expects."""
+        num_landmarks = len(self.landmark_names or [])
+        videos = {}
+        for video_key, (frame_names, frames) in self._videos.items():
+            num_persons = max([len(frame) for frame in frames] + [1])
+            landmarks = np.full((len(frames), num_persons, num_landmarks, len(FIELDS)), np.nan, dtype=np.float32)
+            for frame_idx, frame in enumerate(frames):
+                # frames seen before the landmark names were known had no poses
+                if frame.shape[1] == num_landmarks:
+                    landmarks[frame_idx, :len(frame)] = frame
+            videos[video_key] = {'frames': frame_names, 'landmarks': landmarks}
+        return {'landmark_names': self.landmark_names or [], 'connections': self.connections, 'videos': videos}
+
+    def close(self):
+        save_columnar(self.columns(), self.output_path)
+
+
+def grouped_to_columnar(grouped):
+    """Convert the {'data': {video: {frame: poses}}, 'connections': ...} JSON schema to columnar form."""
+    writer = ColumnarPoseWriter(None, grouped.get('connections'))
+    for video_key, frames in grouped['data'].items():
+        writer.begin_video(video_key)
+        for frame_name, poses in frames.items():
+            writer.write_frame(frame_name, poses)
+    return writer.columns()
+
+
+def columnar_to_grouped(columns, include_person_id=True):
+    """Rebuild the JSON schema written by video_to_skeletons / pngs_to_skeleton."""
+    data = {}
+    for video_key, video in columns['videos'].items():
+        data[video_key] = {frame_name: array_to_poses(frame, columns['landmark_names'], include_person_id)
+                           for frame_name, frame in zip(video['frames'], video['landmarks'])}
+    return {'data': data, 'connections': columns['connections']}
+
+
+def save_columnar(columns, path):
+    """Save to path.npz, or to a directory of memory-mappable .npy files for any other path."""
+    meta = {'landmark_names': columns['landmark_names'], 'connections': columns['connections'],
+            'fields': FIELDS, 'videos': {}}
+    if path.endswith('.npz'):
+        arrays = {}
+        for video_idx, (video_key, video) in enumerate(columns['videos'].items()):
+            meta['videos'][video_key] = {'frames': list(video['frames']), 'array': f'video_{video_idx}'}
+            arrays[f'video_{video_idx}'] = video['landmarks']
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+        return
+
+    os.makedirs(path, exist_ok=True)
+    for video_idx, (video_key, video) in enumerate(columns['videos'].items()):
+        file_name = f'video_{video_idx}.npy'
+        meta['videos'][video_key] = {'frames': list(video['frames']), 'array': file_name}
+        np.save(os.path.join(path, file_name), video['landmarks'])
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def load_columnar(path, mmap=True):
+    """Load a file written by save_columnar. Directory layouts are memory-mapped unless mmap is False."""
+    if path.endswith('.npz'):
+        with np.load(path) as archive:
+            meta = json.loads(str(archive['meta']))
+            videos = {video_key: {'frames': info['frames'], 'landmarks': archive[info['array']]}
+                      for video_key, info in meta['videos'].items()}
+    else:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        videos = {video_key: {'frames': info['frames'],
+                              'landmarks': np.load(os.path.join(path, info['array']), mmap_mode='r' if mmap else None)}
+                  for video_key, info in meta['videos'].items()}
+    return {'landmark_names': meta['landmark_names'], 'connections': meta['connections'], 'videos': videos}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert skeleton JSON to columnar storage and back')
+    parser.add_argument('input', help='Skeleton JSON file, .npz archive or columnar directory')
+    parser.add_argument('output', help='Output .json, .npz or directory path')
+    parser.add_argument('--no_person_id', action='store_true',
+                        help='Omit person_id when writing JSON (the pngs_to_skeleton schema)')
+    args = parser.parse_args()
+
+    if args.input.endswith('.json'):
+        with open(args.input) as f:
+            save_columnar(grouped_to_columnar(json.load(f)), args.output)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(columnar_to_grouped(load_columnar(args.input), not args.no_person_id), f, indent=2)
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Precomputed spline outlines for the viewer.
+
+Does what scripts/outlineAndSkeletonConsolidator.ts and src/main.ts do per
+frame at build and load time (smoothBezierCurve, bez2CatmullSample and
+resampleSplineEquidistant), but on whole arrays, and stores the result as one
+fixed-length (frames, points, 2) float32 array per video:
+
+    8 bytes   magic b"SPLINES\\0"
+    8 bytes   little-endian uint64 length of the JSON header
+    ...       JSON header, padded with spaces to a multiple of 8 bytes
+    ...       per video: a (frames, points, 2) little-endian float32 array
+
+The header maps every video name to its frame and point counts and the byte
+offset of its array, so the viewer can hand each video straight to a GPU
+buffer.
+"""
+import json
+import struct
+import sys
+import numpy as np
+from contourBinary import frame_array
+
+MAGIC = b"SPLINES\0"
+# frames resampled at once; bounds the memory of the dense arc length tables
+CHUNK_FRAMES = 64
+
+
+def smooth_bezier_curves(curves, threshold=20):
+  """
+  Vectorized smoothBezierCurve: curves whose control points are both more than
+  threshold away from their anchors get both control points moved to the
+  midpoint of the anchors. curves is an (N, 8) array; returns a new one.
+  """
+  curves = np.array(curves, dtype=float).reshape((-1, 8))
+  dist1 = np.linalg.norm(curves[:, 2:4] - curves[:, 0:2], axis=1)
+  dist2 = np.linalg.norm(curves[:, 4:6] - curves[:, 6:8], axis=1)
+  wild = (dist1 > threshold) & (dist2 > threshold)
+  midpoint = (curves[wild, 0:2] + curves[wild, 6:8]) / 2
+  curves[wild, 2:4] = midpoint
+  curves[wild, 4:6] = midpoint
+  return curves
+
+
+def bezier_samples(curves, points_per_curve=10):
+  """
+  Vectorized bez2CatmullSample: the first anchor followed by points_per_curve
+  points at t = 1/n .. 1 of every curve, as a (1 + N * points_per_curve, 2) array.
+  """
+  curves = np.asarray(curves, dtype=float).reshape((-1, 4, 2))
+  if len(curves) == 0:
+    return np.zeros((0, 2))
+  t = (np.arange(1, points_per_curve + 1) / points_per_curve)[:, np.newaxis]
+  weights = np.stack([(1 - t)**3, 3 * (1 - t)**2 * t, 3 * (1 - t) * t**2, t**3], axis=1)  # (n, 4, 1)
+  samples = (weights[np.newaxis] * curves[:, np.newaxis]).sum(axis=2)  # (N, n, 2)
+  return np.concatenate([curves[:1, 0], samples.reshape((-1, 2))])
+
+
+def catmull_rom(points, lengths, pos):
+  """
+  Vectorized catmullRomSpline for a batch of padded point lists.
+
+  Parameters:
+      points: (F, L, 2) control points, row f valid up to lengths[f].
+      lengths: (F,) number of control points per row, at least 2.
+      pos: (F, K) spline positions in [0, 1].
+  Returns the (F, K, 2) spline points.
+  """
+  n = (lengths - 1)[:, np.newaxis]
+  segment = np.minimum(np.floor(pos * n), n - 1).astype(int)
+  t = ((pos - segment / n) * n)[..., np.newaxis]
+  take = lambda i: np.take_along_axis(points, i[..., np.newaxis], axis=1)
+  p0 = take(np.maximum(0, segment - 1))
+  p1 = take(segment)
+  p2 = take(np.minimum(segment + 1, n))
+  p3 = take(np.minimum(segment + 2, n))
+  a = -p0 + 3 * p1 - 3 * p2 + p3
+  b = 2 * p0 - 5 * p1 + 4 * p2 - p3
+  c = -p0 + p2
+  return 0.5 * (((a * t + b) * t + c) * t + 2 * p1)
+
+
+def _segment_coefficients(points):
+  # the a, b, c, d vectors catmullRomSpline computes for every segment of one
+  # point list, as a (4, segments, 2) array
+  n = len(points) - 1
+  segment = np.arange(n)
+  p0 = points[np.maximum(0, segment - 1)]
+  p1 = points[segment]
+  p2 = points[np.minimum(segment + 1, n)]
+  p3 = points[np.minimum(segment + 2, n)]
+  return np.stack([-p0 + 3 * p1 - 3 * p2 + p3, 2 * p0 - 5 * p1 + 4 * p2 - p3, -p0 + p2, 2 * p1])
+
+
+def _spline_at(coefficients, pos):
+  # catmullRomSpline(points, pos) for an array of positions, from _segment_coefficients
+  n = coefficients.shape[1]
+  segment = np.minimum(np.floor(pos * n), n - 1).astype(int)
+  t = ((pos - segment / n) * n)[..., np.newaxis]
+  a, b, c, d = coefficients.take(segment, axis=1)
+  return 0.5 * (a * t**3 + b * t**2 + c * t + d)
+
+
+def _distance_along(coefficients, t, num_samples):
+  # calculateDistanceAlongSpline for a batch of end positions t: num_samples
+  # chords from 0 to t, with the loop counter accumulated like the JS for loop
+  steps = np.cumsum(np.repeat((t / num_samples)[:, np.newaxis], num_samples + 1, axis=1), axis=1)
+  inside = steps <= t[:, np.newaxis]
+  pos = np.concatenate([np.zeros((len(t), 1)), np.where(inside, steps, 0)], axis=1)
+  delta = np.diff(_spline_at(coefficients, pos), axis=1)
+  chords = np.sqrt(delta[..., 0] * delta[..., 0] + delta[..., 1] * delta[..., 1])
+  return np.cumsum(np.where(inside, chords, 0), axis=1)[:, -1]
+
+
+def resample_typescript(points, num_points):
+  """
+  resampleSplineEquidistant exactly as src/splineResample.ts computes it, for
+  one (n, 2) point list, vectorized over the output points: the total length
+  from 1000 chords, then a bisection per point on a 100 chord length estimate.
+  Those estimates cut corners on long outlines, so the points are noticeably
+  uneven; resample_equidistant spaces them properly.
+  """
+  coefficients = _segment_coefficients(points)
+  total = _distance_along(coefficients, np.array([1.0]), 1000)[0]
+  segment = total / (num_points - 1)
+  targets = np.arange(1, num_points - 1) * segment
+  left = np.zeros(len(targets))
+  right = np.ones(len(targets))
+  found = np.full(len(targets), np.nan)
+  # the JS loop runs while right - left > 1e-6, i.e. 20 halvings
+  for _ in range(20):
+    mid = (left + right) / 2
+    distance = _distance_along(coefficients, mid, 100)
+    hit = np.isnan(found) & (np.abs(distance - targets) < 1e-6)
+    found[hit] = mid[hit]
+    below = distance < targets
+    left = np.where(below, mid, left)
+    right = np.where(below, right, mid)
+  pos = np.where(np.isnan(found), (left + right) / 2, found)
+  return np.concatenate([points[:1], _spline_at(coefficients, pos), points[-1:]])
+
+
+def resample_equidistant(points, lengths, num_points, samples_per_point=8):
+  """
+  Vectorized resampleSplineEquidistant for a batch of padded point lists:
+  num_points positions at equal arc length along the Catmull-Rom spline of
+  every row, first and last control point included. The arc length is
+  tabulated at samples_per_point spline positions per control point and
+  inverted by linear interpolation, instead of the per-point bisection of the
+  TypeScript version.
+
+  Parameters:
+      points: (F, L, 2) control points, row f valid up to lengths[f].
+      lengths: (F,) number of control points per row, at least 2.
+      num_points: Points per resampled row.
+  Returns an (F, num_points, 2) array.
+  """
+  num_frames = len(points)
+  dense = max(2, samples_per_point * points.shape[1])
+  grid = np.broadcast_to(np.linspace(0, 1, dense), (num_frames, dense))
+  table = catmull_rom(points, lengths, grid)
+  arc = np.concatenate([np.zeros((num_frames, 1)),
+                        np.cumsum(np.linalg.norm(np.diff(table, axis=1), axis=2), axis=1)], axis=1)
+  total = arc[:, -1:]
+  # zero length outlines fall back to evenly spaced positions
+  arc = np.where(total > 0, arc / np.where(total > 0, total, 1), grid)
+
+  # invert every row's arc length table with one searchsorted over all rows,
+  # shifting row f by 2f so the concatenated tables stay sorted
+  targets = np.linspace(0, 1, num_points)
+  shift = 2 * np.arange(num_frames)[:, np.newaxis]
+  flat = (arc + shift).ravel()
+  hi = np.searchsorted(flat, (targets + shift).ravel()).reshape((num_frames, num_points)) - shift // 2 * dense
+  hi = np.clip(hi, 1, dense - 1)
+  arc_hi = np.take_along_axis(arc, hi, axis=1)
+  arc_lo = np.take_along_axis(arc, hi - 1, axis=1)
+  span = arc_hi - arc_lo
+  frac = np.clip((targets - arc_lo) / np.where(span > 0, span, 1), 0, 1)
+  pos = (hi - 1 + frac) / (dense - 1)
+
+  resampled = catmull_rom(points, lengths, pos)
+  resampled[:, 0] = points[:, 0]
+  resampled[:, -1] = np.take_along_axis(points, (lengths - 1)[:, np.newaxis, np.newaxis], axis=1)[:, 0]
+  return resampled
+
+
+def video_spline_samples(frames, smooth_threshold=20, points_per_curve=10):
+  """Smoothed Bezier samples of every frame of a video, as a list of (n, 2) arrays."""
+  return [bezier_samples(smooth_bezier_curves(frame_array(frame), smooth_threshold), points_per_curve)
+          for frame in frames]
+
+
+def resample_video(samples, num_points, typescript=False):
+  """
+  Resamples a list of (n, 2) sample arrays into one (frames, num_points, 2)
+  float32 array, with resample_typescript if typescript is set.
+  """
+  out = np.zeros((len(samples), num_points, 2), dtype=np.float32)
+  if typescript:
+    for i, s in enumerate(samples):
+      out[i] = resample_typescript(s, num_points)
+    return out
+  for start in range(0, len(samples), CHUNK_FRAMES):
+    chunk = samples[start:start + CHUNK_FRAMES]
+    lengths = np.array([len(s) for s in chunk])
+    padded = np.zeros((len(chunk), lengths.max(), 2))
+    for i, s in enumerate(chunk):
+      padded[i, :len(s)] = s
+      # pad with the last point, catmull_rom never reads past a row's length
+      padded[i, len(s):] = s[-1]
+    # the TypeScript spline needs at least 2 points to be defined
+    out[start:start + len(chunk)] = resample_equidistant(padded, np.maximum(lengths, 2), num_points)
+  return out
+
+
+def resample_all_videos(all_video_contours, num_points=None, smooth_threshold=20, points_per_curve=10,
+                        typescript=False):
+  """
+  Turns a {video: {"frames": [...]}} dict into {video: (frames, num_points, 2)
+  float32 array}. num_points defaults to the longest frame's sample count over
+  all videos, the count the consolidator script ends up with. Frames without
+  curves become all zero rows. typescript reproduces the point placement of
+  src/splineResample.ts (see resample_typescript), for a drop-in replacement
+  of the viewer's own resampling; it is about 100 times slower.
+  """
+  samples = {video: video_spline_samples(data["frames"], smooth_threshold, points_per_curve)
+             for video, data in all_video_contours.items()}
+  if num_points is None:
+    num_points = max((len(s) for frames in samples.values() for s in frames), default=2)
+  splines = {}
+  for video, frames in samples.items():
+    valid = [i for i, s in enumerate(frames) if len(s)]
+    splines[video] = np.zeros((len(frames), num_points, 2), dtype=np.float32)
+    if valid:
+      splines[video][valid] = resample_video([frames[i] for i in valid], num_points, typescript)
+  return splines
+
+
+def _pad(n):
+  return (-n) % 8
+
+
+def write_splines_binary(splines, path):
+  """Writes a {video: (frames, points, 2) array} dict in the format described above."""
+  arrays = {video: np.ascontiguousarray(array, dtype="<f4") for video, array in splines.items()}
+  header_len = 0
+  while True:
+    offset = len(MAGIC) + 8 + header_len
+    videos = {}
+    for video, array in arrays.items():
+      videos[video] = {"frames": array.shape[0], "points": array.shape[1], "offset": offset}
+      offset += array.nbytes + _pad(array.nbytes)
+    header = json.dumps({"version": 1, "videos": videos}).encode()
+    needed = len(header) + _pad(len(header))
+    if needed == header_len:
+      break
+    header_len = needed
+
+  with open(path, "wb") as f:
+    f.write(MAGIC)
+    f.write(struct.pack("<Q", header_len))
+    f.write(header + b" " * (header_len - len(header)))
+    for array in arrays.values():
+      f.write(array.tobytes())
+      f.write(b"\0" * _pad(array.nbytes))
+
+
+def read_splines_binary(path):
+  """Returns {video: (frames, points, 2) read-only float32 array} memory-mapped from path."""
+  with open(path, "rb") as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f"{path} is not a spline binary file")
+    header_len, = struct.unpack("<Q", f.read(8))
+    header = json.loads(f.read(header_len))
+  buffer = np.memmap(path, dtype=np.uint8, mode="r")
+  return {video: np.frombuffer(buffer, dtype="<f4", count=info["frames"] * info["points"] * 2,
+                               offset=info["offset"]).reshape((info["frames"], info["points"], 2))
+          for video, info in header["videos"].items()}
+
+
+if __name__ == "__main__":
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Precompute equidistant spline outlines from all_video_contours.json.")
+  parser.add_argument("input", help="all_video_contours.json")
+  parser.add_argument("output", help="Output spline binary file.")
+  parser.add_argument("--points", type=int, default=None,
+                      help="Points per frame (default: the longest frame's sample count).")
+  parser.add_argument("--smooth-threshold", type=float, default=20,
+                      help="Control point distance above which a curve is flattened, as in smoothBezierCurve.")
+  parser.add_argument("--points-per-curve", type=int, default=10, help="Bezier samples per curve.")
+  parser.add_argument("--typescript", action="store_true",
+                      help="Place points exactly like src/splineResample.ts instead of at equal arc length.")
+  args = parser.parse_args()
+
+  with open(args.input) as f:
+    splines = resample_all_videos(json.load(f), args.points, args.smooth_threshold, args.points_per_curve,
+                                  args.typescript)
+  write_splines_binary(splines, args.output)
+  print(f"Wrote {len(splines)} videos to {args.output}", file=sys.stderr)
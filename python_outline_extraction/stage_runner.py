@@ -0,0 +1,203 @@
+"""
+Resumable stage runner for process_video_pngs.
+
+Every stage runs once per video folder. When a video finishes, the runner
+writes a completion marker to <marker_root>/<stage>/<video>.json holding a
+fingerprint of the stage's inputs (file names, sizes and mtimes) and
+parameters, plus the stage's result for that video if it has one. On a rerun,
+every (stage, video) pair whose marker still matches and whose outputs still
+exist is skipped. An interrupted run therefore resumes where it stopped, and
+touching the frames of one video reruns only that video.
+
+Stages whose dependencies are done run concurrently on threads. The heavy
+stages already fan out to subprocesses or process pools, so the threads
+mostly wait.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    Parameters:
+        name: Stage name, used for markers and on the command line.
+        videos: Callable returning the video names to process. It is called
+                when the stage starts, so it can list folders written by
+                earlier stages.
+        run_video: Callable(video) doing the work for one video. Its return
+                   value must be JSON serializable and is kept with the
+                   marker for finish.
+        inputs: Callable(video) returning the input files to fingerprint.
+        outputs: Optional callable(video) returning paths that must still
+                 exist for the marker to count.
+        after: Names of stages that must complete first.
+        params: JSON serializable parameters; changing them invalidates every
+                marker of the stage.
+        finish: Optional callable({video: result}) run once all videos are
+                done, e.g. to merge per-video results into one file.
+        parallelism: Number of videos to run at once, for stages whose
+                     run_video mostly waits on an external tool.
+    """
+
+    def __init__(self, name, videos, run_video, inputs, outputs=None, after=(), params=None, finish=None,
+                 parallelism=1):
+        self.name = name
+        self.videos = videos
+        self.run_video = run_video
+        self.inputs = inputs
+        self.outputs = outputs
+        self.after = tuple(after)
+        self.params = params or {}
+        self.finish = finish
+        self.parallelism = max(parallelism, 1)
+
+
+def fingerprint(paths, params=None):
+    """Hash the names, sizes and modification times of paths together with params."""
+    h = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+            h.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        except OSError:
+            h.update(f"{path}\0missing\n".encode())
+    h.update(json.dumps(params or {}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def list_video_folders(root):
+    """Names of the non-hidden subfolders of root, sorted; empty if root doesn't exist yet."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if not name.startswith(".") and os.path.isdir(os.path.join(root, name)))
+
+
+def list_files(folder, extension=".png"):
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(extension)]
+
+
+class StageRunner:
+    """Runs stages in dependency order, skipping videos whose markers are still valid."""
+
+    def __init__(self, stages, marker_root, force=False, concurrent=True):
+        self.stages = {stage.name: stage for stage in stages}
+        self.marker_root = marker_root
+        self.force = force
+        self.concurrent = concurrent
+        self.summary = {}
+        self._print_lock = threading.Lock()
+
+    def _log(self, *args):
+        with self._print_lock:
+            print(*args)
+
+    def _marker_path(self, stage, video):
+        return os.path.join(self.marker_root, stage.name, video + ".json")
+
+    def _load_marker(self, stage, video, key):
+        if self.force:
+            return None
+        try:
+            with open(self._marker_path(stage, video)) as f:
+                marker = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if marker.get("fingerprint") != key:
+            return None
+        if stage.outputs is not None and not all(os.path.exists(path) for path in stage.outputs(video)):
+            return None
+        return marker
+
+    def _write_marker(self, stage, video, key, result):
+        path = self._marker_path(stage, video)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file and rename so a crash never leaves a half written marker
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"fingerprint": key, "finished": time.time(), "result": result}, f)
+        os.replace(tmp_path, path)
+
+    def run_stage(self, stage):
+        """Run one stage over all its videos and record its entry in self.summary."""
+        start = time.perf_counter()
+        results = {}
+        ran, skipped, failed = [], [], []
+        todo = []
+        videos = stage.videos()
+        for video in videos:
+            key = fingerprint(stage.inputs(video), stage.params)
+            marker = self._load_marker(stage, video, key)
+            if marker is not None:
+                results[video] = marker["result"]
+                skipped.append(video)
+            else:
+                todo.append((video, key))
+
+        def run_video(video, key):
+            self._log(f"[{stage.name}] {video}")
+            try:
+                result = stage.run_video(video)
+            except Exception as e:
+                self._log(f"[{stage.name}] {video} failed: {e}")
+                return False
+            self._write_marker(stage, video, key, result)
+            results[video] = result
+            return True
+
+        with ThreadPoolExecutor(max_workers=stage.parallelism) as executor:
+            futures = [(video, executor.submit(run_video, video, key)) for video, key in todo]
+            for video, future in futures:
+                (ran if future.result() else failed).append(video)
+
+        if stage.finish is not None and not failed:
+            # videos may finish out of order, hand them over in listing order
+            stage.finish({video: results[video] for video in videos if video in results})
+        self.summary[stage.name] = {"seconds": time.perf_counter() - start, "ran": len(ran),
+                                    "skipped": len(skipped), "failed": failed}
+        self._log(f"[{stage.name}] done: {len(ran)} ran, {len(skipped)} up to date, {len(failed)} failed")
+        return not failed
+
+    def run(self, names):
+        """
+        Run the named stages. Dependencies that were not selected are assumed
+        to be done already. Stages that depend on a failed stage are skipped.
+        Returns True if every selected stage succeeded.
+        """
+        pending = [name for name in self.stages if name in names]
+        done, failed = set(), set()
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1) if self.concurrent else 1) as executor:
+            while pending:
+                blocked = [name for name in pending if set(self.stages[name].after) & failed]
+                for name in blocked:
+                    self._log(f"[{name}] skipped because a stage it depends on failed")
+                    self.summary[name] = {"seconds": 0.0, "ran": 0, "skipped": 0, "failed": ["(dependency)"]}
+                    failed.add(name)
+                pending = [name for name in pending if name not in blocked]
+                ready = [name for name in pending
+                         if all(dep in done for dep in self.stages[name].after if dep in names)]
+                if not ready:
+                    break
+                futures = {name: executor.submit(self.run_stage, self.stages[name]) for name in ready}
+                for name, future in futures.items():
+                    (done if future.result() else failed).add(name)
+                pending = [name for name in pending if name not in ready]
+        return not failed
+
+    def print_summary(self):
+        print(f"{'stage':<12}{'seconds':>10}{'ran':>6}{'skipped':>9}  failed")
+        for name in self.stages:
+            if name not in self.summary:
+                continue
+            entry = self.summary[name]
+            print(f"{name:<12}{entry['seconds']:>10.1f}{entry['ran']:>6}{entry['skipped']:>9}  "
+                  f"{', '.join(entry['failed'])}")
@@ -0,0 +1,67 @@
+"""
+Synthetic RGBA silhouettes for benchmarking contour extraction.
+
+A silhouette is a closed blob whose radius is a sum of `complexity` random
+harmonics, so higher complexity gives a longer, wigglier outline that needs
+more Bezier segments. Frames of a sequence slowly rotate the harmonic phases,
+so consecutive frames look alike, as in a real video. Everything is seeded,
+so the same arguments always produce the same pixels.
+"""
+import argparse
+import os
+import cv2
+import numpy as np
+
+
+def silhouette_polygon(width, height, complexity=8, t=0.0, seed=0, num_points=2048):
+    """
+    Returns the (num_points, 2) int32 outline of the silhouette at time t.
+    complexity is the number of harmonics added to the base circle.
+    """
+    rng = np.random.default_rng(seed)
+    orders = rng.integers(2, 4 * complexity + 3, complexity)
+    # higher harmonics get smaller amplitudes so the outline never self-intersects
+    amplitudes = rng.uniform(0.3, 1.0, complexity) / orders
+    amplitudes *= 0.6 / max(amplitudes.sum(), 0.6)
+    phases = rng.uniform(0, 2 * np.pi, complexity)
+    speeds = rng.uniform(-0.2, 0.2, complexity)
+
+    theta = np.linspace(0, 2 * np.pi, num_points, endpoint=False)
+    radius = 1.0 + (amplitudes[:, np.newaxis]
+                    * np.sin(orders[:, np.newaxis] * theta + (phases + speeds * t)[:, np.newaxis])).sum(axis=0)
+    scale = 0.4 * min(width, height) / 1.6
+    center = np.array([width / 2, height / 2])
+    points = center + scale * radius[:, np.newaxis] * np.stack([np.cos(theta), np.sin(theta)], axis=1)
+    return np.round(points).astype(np.int32)
+
+
+def silhouette_frame(width, height, complexity=8, t=0.0, seed=0):
+    """Returns a (height, width, 4) BGRA frame: opaque silhouette on a transparent background."""
+    frame = np.zeros((height, width, 4), dtype=np.uint8)
+    frame[..., 1] = 200
+    cv2.fillPoly(frame, [silhouette_polygon(width, height, complexity, t, seed)], (90, 60, 40, 255))
+    return frame
+
+
+def write_sequence(folder, num_frames, width=960, height=540, complexity=8, seed=0):
+    """Writes num_frames PNGs named like the frames process_video_pngs produces. Returns their paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(num_frames):
+        path = os.path.join(folder, f"{i:05d}.png")
+        cv2.imwrite(path, silhouette_frame(width, height, complexity, i, seed))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a folder of synthetic RGBA silhouette frames.")
+    parser.add_argument("folder", help="Output folder.")
+    parser.add_argument("--frames", type=int, default=30, help="Number of frames.")
+    parser.add_argument("--size", type=int, nargs=2, default=(960, 540), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--complexity", type=int, default=8, help="Number of harmonics in the outline.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_sequence(args.folder, args.frames, args.size[0], args.size[1], args.complexity, args.seed)
+    print(f"Wrote {args.frames} frames to {args.folder}")
@@ -5,6 +5,10 @@ import cv2
 import argparse
 import os
 import json
+import queue
+import threading
+from memory_monitor import MemoryMonitor
+from skeleton_columnar import ColumnarPoseWriter
 
 connections = [
   ["NOSE", "LEFT_EYE_INNER"],
@@ -46,11 +50,16 @@ connections = [
 ]
 
 
-def create_pose_detector(model_path='pose_landmarker_heavy.task', max_num_poses=3):
-    """Create and return a pose detector instance that can detect multiple people."""
+def create_pose_detector(model_path='pose_landmarker_heavy.task', max_num_poses=3, running_mode='image'):
+    """
+    Create and return a pose detector instance that can detect multiple people.
+    running_mode 'video' lets MediaPipe track poses between consecutive frames;
+    such a detector must be fed with process_image(..., timestamp_ms=...).
+    """
     base_options = python.BaseOptions(model_asset_path=model_path, delegate=python.BaseOptions.Delegate.GPU)
     options = vision.PoseLandmarkerOptions(
         base_options=base_options,
+        running_mode=vision.RunningMode.VIDEO if running_mode == 'video' else vision.RunningMode.IMAGE,
         output_segmentation_masks=False,
         num_poses=max_num_poses,
         min_pose_detection_confidence=0.25,
@@ -59,16 +68,20 @@ def create_pose_detector(model_path='pose_landmarker_heavy.task', max_num_poses=
     )
     return vision.PoseLandmarker.create_from_options(options)
 
-def process_image(detector, image):
+def process_image(detector, image, timestamp_ms=None):
     """
     Process a single MediaPipe Image (or file-path) and return a list of
-    all detected poses, each with its own landmarks.
+    all detected poses, each with its own landmarks. Pass timestamp_ms for
+    detectors created in 'video' running mode.
     """
     # Load image if a path was provided
     if isinstance(image, str):
         image = mp.Image.create_from_file(image)
 
-    result = detector.detect(image)
+    if timestamp_ms is None:
+        result = detector.detect(image)
+    else:
+        result = detector.detect_for_video(image, timestamp_ms)
 
     # Landmark names
     pose_landmark_names = [lm.name for lm in mp.solutions.pose.PoseLandmark]
@@ -93,7 +106,44 @@ def process_image(detector, image):
 
     return poses
 
-def process_video(detector, video_path):
+class StreamingPoseWriter:
+    """
+    Writes the same JSON layout as json.dump(process_video(...)) one frame at a
+    time, so finished frames don't have to be kept in memory.
+    """
+
+    def __init__(self, output_file, connections=connections):
+        self.connections = connections
+        self._file = open(output_file, 'w')
+        self._file.write('{"data": {')
+        self._videos = 0
+        self._frames = 0
+
+    def begin_video(self, video_key):
+        if self._videos:
+            self._file.write('}, ')
+        self._file.write(json.dumps(video_key) + ': {')
+        self._videos += 1
+        self._frames = 0
+
+    def write_frame(self, frame_name, poses):
+        if self._frames:
+            self._file.write(', ')
+        self._file.write(json.dumps(frame_name) + ': ' + json.dumps(poses))
+        self._frames += 1
+
+    def close(self):
+        if self._videos:
+            self._file.write('}')
+        self._file.write('}, "connections": ' + json.dumps(self.connections) + '}')
+        self._file.close()
+
+def process_video(detector, video_path, writer=None, monitor=None):
+    """
+    Run the detector over every frame of a video. With a StreamingPoseWriter,
+    frames are written out as they are computed and the returned dict holds no
+    frame data; a MemoryMonitor gets called once per frame.
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise RuntimeError(f"Cannot open video file {video_path}")
@@ -108,6 +158,8 @@ def process_video(detector, video_path):
 
     video_key = os.path.splitext(os.path.basename(video_path))[0]
     grouped['data'][video_key] = {}
+    if writer is not None:
+        writer.begin_video(video_key)
 
     frame_idx = 0
     while True:
@@ -122,11 +174,16 @@ def process_video(detector, video_path):
 
         try:
             poses = process_image(detector, mp_image)
-            grouped['data'][video_key][f'frame_{frame_idx}.png'] = poses
+            if writer is not None:
+                writer.write_frame(f'frame_{frame_idx}.png', poses)
+            else:
+                grouped['data'][video_key][f'frame_{frame_idx}.png'] = poses
         except Exception as e:
             print(f"Error on frame {frame_idx}: {e}")
         if frame_idx % 100 == 0:
             print(f"Processing frame {frame_idx}...")
+        if monitor is not None:
+            monitor.frame(frame_idx)
         if frame_idx % 500 == 0:
             # recreate detector to free up memory
             detector.close()
@@ -136,6 +193,155 @@ def process_video(detector, video_path):
     cap.release()
     return grouped
 
+def _put_unless_stopped(q, item, stop):
+    """Put item into a bounded queue, giving up once stop is set so a dead consumer can't block us forever."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _decode_frames(cap, frame_queue, num_workers, errors, stop):
+    """Decode thread: feed (frame_idx, timestamp_ms, mp_image) into the bounded queue."""
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_idx = 0
+        last_timestamp = -1
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+            # VIDEO mode needs strictly increasing timestamps
+            timestamp_ms = max(int(round(frame_idx * 1000.0 / fps)), last_timestamp + 1)
+            last_timestamp = timestamp_ms
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGBA, data=rgba)
+            if not _put_unless_stopped(frame_queue, (frame_idx, timestamp_ms, mp_image), stop):
+                break
+            frame_idx += 1
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        for _ in range(num_workers):
+            _put_unless_stopped(frame_queue, None, stop)
+
+def _infer_frames(detector, frame_queue, result_queue, use_timestamps, stop):
+    """
+    Inference worker: owns one detector and drains the frame queue until it sees
+    the end marker (or stop is set), posting (frame_idx, poses) results (poses
+    None on error).
+    """
+    try:
+        while not stop.is_set():
+            try:
+                item = frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            frame_idx, timestamp_ms, mp_image = item
+            poses = None
+            try:
+                poses = process_image(detector, mp_image, timestamp_ms if use_timestamps else None)
+            except Exception as e:
+                print(f"Error on frame {frame_idx}: {e}")
+            result_queue.put((frame_idx, poses))
+            if frame_idx % 100 == 0:
+                print(f"Processing frame {frame_idx}...")
+    finally:
+        detector.close()
+        result_queue.put(None)
+
+def process_video_pipelined(video_path, model_path='pose_landmarker_heavy.task', max_num_poses=3,
+                            num_workers=1, queue_size=32, running_mode='image', writer=None, monitor=None):
+    """
+    Same output as process_video, but decodes on a separate thread and runs
+    inference on num_workers threads, each with its own detector. At most
+    queue_size decoded frames are held in memory at a time, so memory stays
+    bounded without recreating detectors.
+
+    In 'video' running mode frames are fed to a single detector in order with
+    their timestamps so MediaPipe can track poses between frames; tracking
+    needs every frame, so num_workers is forced to 1.
+
+    writer and monitor behave as in process_video; results are reordered so
+    frames are always written in frame order. Detectors are created before any
+    thread starts, so a failing model load raises here instead of stalling the
+    decoder; decode errors are re-raised once the threads have stopped.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video file {video_path}")
+
+    use_timestamps = running_mode == 'video'
+    if use_timestamps:
+        num_workers = 1
+
+    video_key = os.path.splitext(os.path.basename(video_path))[0]
+    grouped = {
+        'data': {video_key: {}},
+        'connections': connections
+    }
+    if writer is not None:
+        writer.begin_video(video_key)
+
+    detectors = []
+    try:
+        for _ in range(num_workers):
+            detectors.append(create_pose_detector(model_path, max_num_poses, running_mode))
+    except Exception:
+        for detector in detectors:
+            detector.close()
+        cap.release()
+        raise
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue()
+    errors = []
+    stop = threading.Event()
+
+    decoder = threading.Thread(target=_decode_frames, args=(cap, frame_queue, num_workers, errors, stop))
+    workers = [threading.Thread(target=_infer_frames, args=(detector, frame_queue, result_queue, use_timestamps, stop))
+               for detector in detectors]
+    decoder.start()
+    for worker in workers:
+        worker.start()
+
+    try:
+        # workers finish frames out of order; hold results until all earlier frames are in
+        pending = {}
+        next_idx = 0
+        running = num_workers
+        while running:
+            item = result_queue.get()
+            if item is None:
+                running -= 1
+                continue
+            pending[item[0]] = item[1]
+            while next_idx in pending:
+                poses = pending.pop(next_idx)
+                if poses is not None:
+                    if writer is not None:
+                        writer.write_frame(f'frame_{next_idx}.png', poses)
+                    else:
+                        grouped['data'][video_key][f'frame_{next_idx}.png'] = poses
+                if monitor is not None:
+                    monitor.frame(next_idx)
+                next_idx += 1
+    finally:
+        # also unblocks the threads if writing a frame failed
+        stop.set()
+        for worker in workers:
+            worker.join()
+        decoder.join()
+        cap.release()
+    if errors:
+        raise errors[0]
+    return grouped
+
 def main():
     parser = argparse.ArgumentParser(
         description='Compute multi-person pose landmarks per frame of an MP4 video'
@@ -151,7 +357,39 @@ def main():
         '--max_poses', type=int, default=3,
         help='Maximum number of people to detect per frame'
     )
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='Run the pipelined decoder with this many inference workers, each with its own detector'
+    )
+    parser.add_argument(
+        '--queue_size', type=int, default=32,
+        help='Maximum number of decoded frames waiting for inference in pipelined mode'
+    )
+    parser.add_argument(
+        '--running_mode', choices=['image', 'video'], default='image',
+        help="'video' tracks poses between frames using frame timestamps (implies pipelined mode, one worker)"
+    )
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='Write each frame to the output file as soon as it is computed instead of holding the whole video in memory'
+    )
+    parser.add_argument(
+        '--format', choices=['json', 'columnar'], default='json',
+        help="'columnar' saves (frames, persons, 33, 5) float32 arrays instead of JSON; "
+             "use a .npz output_file for one archive or any other path for a directory of .npy files"
+    )
+    parser.add_argument(
+        '--memory_every', type=int, default=None,
+        help='Report process RSS every N frames'
+    )
+    parser.add_argument(
+        '--tracemalloc', action='store_true',
+        help='With --memory_every, also report the Python allocations that grew the most'
+    )
     args = parser.parse_args()
+    if args.stream and args.format == 'columnar':
+        # ColumnarPoseWriter keeps every frame in memory until close, so it can't stream
+        parser.error("--stream only works with --format json")
 
     # Generate output filename if not provided
     if args.output_file is None:
@@ -165,11 +403,30 @@ def main():
         print("    https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_heavy/float16/1/pose_landmarker_heavy.task")
         return
 
-    detector = create_pose_detector(args.model, args.max_poses)
-    results = process_video(detector, args.video_path)
+    if args.format == 'columnar':
+        writer = ColumnarPoseWriter(args.output_file, connections)
+    else:
+        writer = StreamingPoseWriter(args.output_file) if args.stream else None
+    monitor = MemoryMonitor(args.memory_every, args.tracemalloc) if args.memory_every else None
+
+    try:
+        if args.workers is not None or args.running_mode == 'video':
+            results = process_video_pipelined(args.video_path, args.model, args.max_poses,
+                                              args.workers or 1, args.queue_size, args.running_mode,
+                                              writer, monitor)
+        else:
+            detector = create_pose_detector(args.model, args.max_poses)
+            results = process_video(detector, args.video_path, writer, monitor)
+    finally:
+        # leaves a well-formed (if partial) output file when processing fails
+        if monitor is not None:
+            monitor.close()
+        if writer is not None:
+            writer.close()
 
-    with open(args.output_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    if writer is None:
+        with open(args.output_file, 'w') as f:
+            json.dump(results, f, indent=2)
     print(f"Results saved to {args.output_file}")
 
 if __name__ == "__main__":